@@ -4,8 +4,10 @@ from collections import defaultdict
 import math
 import time
 from agents.mcts import mcts_env
-from agents.mcts.mcts_node import MCTSNode
-from agents.rule_based.ruleset import Ruleset
+from agents.mcts.mcts_node import MCTSNode, ChildrenCache, PolicyCache
+from agents.mcts.mcts_evaluator import LinearEvaluator
+from agents.mcts.mcts_profiler import NullProfiler, SearchProfiler
+from agents.rule_based.ruleset import Ruleset, RulePipeline
 from agents.rule_based.rule_based_agents import VanDenBerghAgent
 from agents.rule_based.rule_based_agents import OuterAgent
 from agents.rule_based.rule_based_agents import InnerAgent
@@ -45,6 +47,8 @@ class MCTSAgent(Agent):
     self.score_type = mcts_env.ScoreType.SCORE
     self.playable_now_convention = False # Agent will follow playable now convention
     self.playable_now_convention_sim = False # Agents in simulation follow playable now convention
+    # Keep determinization moves from growing the move history of rollout states
+    self.history_mode = pyhanabi.HanabiHistoryMode.COMPACT_DETERMINIZATION
     self.rules =  [Ruleset.tell_most_information_factory(True)  # TellMostInformation
         , Ruleset.tell_anyone_useful_card  # TellAnyoneUseful
         , Ruleset.tell_dispensable_factory(8)
@@ -54,13 +58,48 @@ class MCTSAgent(Agent):
         , Ruleset.play_probably_safe_factory(0.7, False)
         , Ruleset.play_probably_safe_late_factory(0.4, 5)
         , Ruleset.discard_most_confident]
+    # Decision triage before search: a shortcut rule's action is taken as is, and search is
+    # skipped when the rules leave a single distinct candidate
+    self.triage_shortcuts = []
+    self.triage_stats = {'decisions': 0, 'convention': 0, 'shortcut': 0, 'single_candidate': 0, 'searched': 0}
+    # Bound on remembered rule expansions, keyed by information state. 0 disables it. Off by default:
+    # information states rarely recur within a search, so nearly every lookup misses
+    self.children_cache_size = 0
+    # Bound on remembered deterministic simulation agent decisions. 0 disables it
+    self.policy_cache_size = 0
+    # Rollouts only read reward(), so the forward model skips the detailed move stats
+    self.rollout_stats = False
+    # Score types backpropagated alongside score_type, so one search reports the move each would choose
+    self.objectives = []
+    self.objective_moves = {}
+    self.objective_stats = {}
+    # Values the state a simulation stops at, short of the game end. None scores it by reward() alone
+    self.leaf_evaluator = None
+    self.leaf_value = 0
     self.mcts_type = config["mcts_types"][config['player_id']]
+    # MB: Opt-in phase timings and search counters, see mcts_profiler
+    self.profiler = SearchProfiler() if config.get('profile', False) else NullProfiler()
     self._edit_mcts_config(self.mcts_type, config)
+    self.rule_pipeline = RulePipeline(self.rules) if self.rules is not None else None
+    self.objective_stats = {f'agree_{score_type.name.lower()}': 0 for score_type in self.objectives}
+    # Kept across act calls: information states recur across rollouts and turns
+    self.children_cache = ChildrenCache(self.children_cache_size) if self.rules is not None and self.children_cache_size > 0 else None
+    self.policy_cache = PolicyCache(self.policy_cache_size) if self.policy_cache_size > 0 else None
     # Make use of special MCTSEnv that allows redterminizing hands during rollouts
     self.environment = mcts_env.make('Hanabi-Full', num_players=config["players"], mcts_player=config['player_id']
-                                     ,determine_type = self.determine_type, score_type = self.score_type)
+                                     ,determine_type = self.determine_type, score_type = self.score_type
+                                     ,record_stats = self.rollout_stats, objectives = self.objectives
+                                     ,seed = self._forward_model_seed(config))
     self.max_information_tokens = config.get('information_tokens', 8)
 
+  @staticmethod
+  def _forward_model_seed(config):
+    """Seed for the forward model's deals, distinct per player, from config['seed'] when given"""
+    seed = config.get('seed', -1)
+    if seed == -1:
+      return -1
+    return (seed * (config['players'] + 1) + 1 + config['player_id']) % 2**31
+
   def _edit_mcts_config(self, mcts_type, config):
     """Interpret the mcts_type character"""
     if mcts_type == '0': #default
@@ -195,6 +234,20 @@ class MCTSAgent(Agent):
       self.score_type = mcts_env.ScoreType.REGRET
       self.max_depth = 1
       self.max_simulation_steps = config["players"] - 1
+    elif mcts_type == 'y':  # triage_safe
+      self.triage_shortcuts = [Ruleset.play_safe_card]
+    elif mcts_type == 'z':  # objectives: default search, also reporting the regret and progress choices
+      self.objectives = [mcts_env.ScoreType.SCORE, mcts_env.ScoreType.REGRET, mcts_env.ScoreType.PROGRESS]
+    elif mcts_type == 'A':  # evaluator: leaf evaluator instead of simulation
+      self.leaf_evaluator = LinearEvaluator()
+      self.max_simulation_steps = 0
+    elif mcts_type == 'B':  # evaluator_sim1: leaf evaluator after a one step simulation
+      self.leaf_evaluator = LinearEvaluator()
+      self.max_simulation_steps = 1
+    elif mcts_type == 'C':  # policy_cache: default search, simulation agent decisions cached
+      self.policy_cache_size = 16384
+    elif mcts_type == 'D':  # children_cache: default search, rule expansions cached
+      self.children_cache_size = 4096
     elif mcts_type == 'x': #fast test
       self.max_rollout_num = 10
       self.score_type = mcts_env.ScoreType.REGRET
@@ -207,11 +260,42 @@ class MCTSAgent(Agent):
     else:
       print(f"'mcts_config_error {mcts_type}',")
 
+  def mcts_config(self):
+    """Search settings, as a dict of literals. Agents and rules are given by name"""
+    return {'max_time_limit': self.max_time_limit, 'max_rollout_num': self.max_rollout_num
+            , 'agents': [type(agent).__name__ for agent in self.agents], 'max_simulation_steps': self.max_simulation_steps, 'max_depth': self.max_depth
+            , 'determine_type': int(self.determine_type), 'score_type': int(self.score_type), 'exploration_weight': self.exploration_weight
+            , 'playable_now_convention': self.playable_now_convention, 'playable_now_convention_sim': self.playable_now_convention_sim, 'rules': None if self.rules is None else [rule.__name__ for rule in self.rules]
+            , 'history_mode': int(self.history_mode), 'children_cache_size': self.children_cache_size
+            , 'policy_cache_size': self.policy_cache_size
+            , 'triage_shortcuts': [rule.__name__ for rule in self.triage_shortcuts], 'rollout_stats': self.rollout_stats
+            , 'objectives': [score_type.name for score_type in self.objectives], 'leaf_evaluator': None if self.leaf_evaluator is None else str(self.leaf_evaluator)}
+
   def _get_mcts_config(self):
-    return f"{{'max_time_limit':{self.max_time_limit}, 'max_rollout_num':{self.max_rollout_num}" \
-           f",'agents':'{self.agents}', 'max_simulation_steps':{self.max_simulation_steps}, 'max_depth':{self.max_depth}" \
-           f", 'determine_type':{self.determine_type}, 'score_type':{self.score_type}, 'exploration_weight':{self.exploration_weight}" \
-           f",'playable_now_convention':{self.playable_now_convention},'playable_now_convention_sim':{self.playable_now_convention_sim}, 'rules':'{self.rules}'}}," \
+    return f"{self.mcts_config()},"
+
+  def stats(self):
+    """Counts of how decisions were made. Shares of 'decisions' give the search skip rates
+    With objectives, agree_<objective> counts searched decisions where that objective chose the move played
+    Enabled caches add <cache>_hits and <cache>_misses"""
+    stats = dict(self.triage_stats)
+    stats.update(self.objective_stats)
+    stats.update(self.profiler.stats())
+    if self.children_cache is not None:
+      stats.update(self._cache_stats('children_cache', self.children_cache))
+    if self.policy_cache is not None:
+      stats.update(self._cache_stats('policy_cache', self.policy_cache))
+    return stats
+
+  @staticmethod
+  def _cache_stats(name, cache):
+    """Hit and miss counts of cache under prefixed keys. Size is left out, as agent_stats are summed over episodes"""
+    cache_stats = cache.stats()
+    return {f'{name}_hits': cache_stats['hits'], f'{name}_misses': cache_stats['misses']}
+
+  def move_profile(self):
+    """Phase times (ms) and search counters of the last move, or None if it was not searched or not profiling"""
+    return self.profiler.move_stats()
 
   def __str__(self):
     return 'MCTSAgent'+str(self.mcts_type)
@@ -223,13 +307,23 @@ class MCTSAgent(Agent):
     debug = False
     if observation['current_player_offset'] != 0:
       return None
+    self.triage_stats['decisions'] += 1
+    self.profiler.clear_move()
 
     # Playable Now convention: If I was told a single information about a single card, and it could be playable, do it
     if self.playable_now_convention:
       action = Ruleset.playable_now_convention(observation)
       if action is not None:
+        self.triage_stats['convention'] += 1
         return action
 
+    action = self._triage(observation, state)
+    if action is not None:
+      return action
+    self.triage_stats['searched'] += 1
+
+    self.profiler.start_move()
+    valid_hand_retries = self.environment.valid_hand_retries
     self._reset(state)
 
     if debug:
@@ -252,6 +346,7 @@ class MCTSAgent(Agent):
       self.environment.reset(observation)
       if debug: print("mcts_agent.act: Player {} did master determinisation".format(self.environment.state.cur_player()))
       if debug: self.environment.print_state()
+      self.profiler.lap('determinize')
       # Rollout one iteration under this master determinisation
       path, reward = self._do_rollout(self.root_node, observation)
       rollout += 1
@@ -276,7 +371,13 @@ class MCTSAgent(Agent):
 
     self.root_node.focused_state = self.root_state.copy()
     best_node = self._choose(self.root_node)
+    if self.objectives and self.root_node in self.children:
+      self._record_objective_choices(best_node)
     if debug: print(f"mcts_agent.act: Chose node {best_node}")
+    self.profiler.lap('choose')
+    self.profiler.count('rollouts', rollout)
+    self.profiler.count('valid_hand_retries', self.environment.valid_hand_retries - valid_hand_retries)
+    self.profiler.end_move()
     #print(f"mcts_agent.act: Tree looks like {self._get_tree_string()}")
     #print(f"mcts_agent.act: Chose node {best_node}")
     #if max([q/n for q,n in zip(self.Q.values(),self.N.values())]) > 1:
@@ -284,6 +385,26 @@ class MCTSAgent(Agent):
     return best_node.initial_move()
 
 
+  def _triage(self, observation, state):
+    """Move to take without searching, or None"""
+    for rule in self.triage_shortcuts:
+      action = rule(observation)
+      if action is not None:
+        self.triage_stats['shortcut'] += 1
+        return action
+    if self.rules is None:
+      return None
+    # The root's children would be exactly these, so a single candidate is what search would choose
+    # Moves are checked against the legal moves of the real state. The forward model gets a copy,
+    # so nothing it does before the next rollout resets it can change the real game
+    self.environment.state = state.copy()
+    actions = self.rule_pipeline.all(observation)
+    moves = list(dict.fromkeys(self.environment._build_move(action) for action in actions if action is not None))
+    if len(moves) == 1:
+      self.triage_stats['single_candidate'] += 1
+      return moves[0]
+    return None
+
   def _do_rollout(self, node, observation):
     debug = False
     # Do rollout tries to roll the focused state according to the moves in the tree
@@ -291,6 +412,8 @@ class MCTSAgent(Agent):
     # Select the path through tree and expansion node
     path = self._select(node)
     leaf = path[-1]
+    self.profiler.depth(len(path) - 1)
+    self.profiler.lap('select')
     if debug: print(f"MB: mcts_agent._do_rollout: Leaf node to roll out from is {leaf}")
 
     # Try to get down to the selected node to roll out from it
@@ -298,30 +421,38 @@ class MCTSAgent(Agent):
     for move in leaf.moves:
       # If move not legal on this determinisation cut path here are backpropogate
       if (not any(move == legal_move for legal_move in self.environment.state.legal_moves())):
+        self.profiler.count('replay_steps', depth)
+        self.profiler.lap('replay')
         reward = self.environment.reward()
-        self._backpropagate(path, reward)
+        self._backpropagate(path, reward, self._objective_rewards())
+        self.profiler.lap('backpropagate')
         return path, reward
       if debug: print(f"mcts_agent._do_rollout: Trying to step move: {move}")
-      observations, reward, done, unused_info = self.environment.step(move)
-      observation = observations['player_observations'][self.environment.state.cur_player()]
+      observation, reward, done, unused_info = self.environment.step_acting(move)
       if debug: print(self.environment.state)
       depth += 1
       if depth > self.max_depth:
         break
       #ToDO: This seems debateable...
 
+    self.profiler.count('replay_steps', depth)
+    self.profiler.lap('replay')
     leaf.focused_state = self.environment.state
     # Don't expand if we didn't get to a root
     if not depth > self.max_depth:
       self._expand(leaf, observation)
+    self.profiler.lap('expand')
     # Simulate from this point
     reward = self._simulate(leaf)
-    self._backpropagate(path, reward)
+    self.profiler.lap('simulate')
+    self._backpropagate(path, reward, self._objective_rewards(self.leaf_value))
+    self.profiler.lap('backpropagate')
     return path, reward
 
 
-  def _choose(self, node):
-    ''' Choose the final move in game by best average score'''
+  def _choose(self, node, objective=None):
+    ''' Choose the final move in game by best average score
+    objective: index into self.objectives to choose by that objective's average instead'''
     if node.is_terminal():
       raise RuntimeError(f"choose called on terminal node {node}")
     if node not in self.children:
@@ -331,10 +462,21 @@ class MCTSAgent(Agent):
     def score(n):
       if self.N[n] <= 1:
         return float("-inf")  # avoid rarely seen moves
+      if objective is not None:
+        return self.Q_objectives[n][objective] / self.N[n]
       return self.Q[n] / self.N[n]  # average reward
 
     return max(self.children[node], key=score)
 
+  def _record_objective_choices(self, best_node):
+    """Note the move each objective would have chosen from this search"""
+    self.objective_moves = {}
+    for objective, score_type in enumerate(self.objectives):
+      node = self._choose(self.root_node, objective)
+      self.objective_moves[score_type.name] = node.initial_move()
+      if node == best_node:
+        self.objective_stats[f'agree_{score_type.name.lower()}'] += 1
+
   def _select(self, node):
     "Find an unexplored descendent of `node`"
     path = []
@@ -343,9 +485,9 @@ class MCTSAgent(Agent):
       if node not in self.children or not self.children[node]:
         # node is either unexplored or terminal
         return path
-      unexplored = self.children[node] - self.children.keys()
-      if unexplored:
-        n = unexplored.pop()
+      # First unexplored child in expansion order, so runs with the same seeds repeat (a set pop follows str hashing)
+      n = next((child for child in self.children[node] if child not in self.children), None)
+      if n is not None:
         path.append(n)
         return path
       node = self._uct_select(node)  # descend a layer deeper
@@ -360,12 +502,25 @@ class MCTSAgent(Agent):
       return
     if debug: print(f"mcts_agent._expand: Expanding children for node: {node}")
 
+    if self.children_cache is not None and not node.is_terminal():
+      key = ChildrenCache.key(observation)
+      moves = self.children_cache.get(key)
+      if moves is None:
+        moves = self._find_child_moves(node, observation)
+        self.children_cache.put(key, moves)
+    else:
+      moves = self._find_child_moves(node, observation)
+    self.children[node] = [MCTSNode(node.moves+(move,), self.rules) for move in moves]
+    self.profiler.count('nodes_created', len(moves))
+    if debug: print(f"mcts_agent._expand: Took assigned node {node} and updated children {self.children[node]}")
+
+  def _find_child_moves(self, node, observation):
+    """Deduplicated child moves of node, in the order the rules found them"""
     moves = node.find_children(observation)
     # Need it in move form. If in action form, convert them
     if len(moves) > 0 and isinstance(moves[0], dict):
-      moves = set([self.environment._build_move(action) for action in moves])
-    self.children[node] = [MCTSNode(node.moves+(move,), self.rules) for move in moves]
-    if debug: print(f"mcts_agent._expand: Took assigned node {node} and updated children {self.children[node]}")
+      moves = list(dict.fromkeys(self.environment._build_move(action) for action in moves))
+    return moves
 
   def _simulate(self, node):
     "MB: Returns the reward for a random simulation (to completion) of `node`"
@@ -373,38 +528,63 @@ class MCTSAgent(Agent):
 
     # MB: Note: The nodes state needs to be copied and determinized/sound by here
     self.environment.state = node.focused_state
-    observations = self.environment._make_observation_all_players()
 
     done = node.is_terminal()
     reward = self.environment.reward()
     steps = 0
+    # Only the acting player's observation is built: the other agents would not act on theirs
+    observation = None if done else self.environment.acting_observation()
 
     while not done and steps < self.max_simulation_steps:
-      for agent_id, agent in enumerate(self.agents):
-        observation = observations['player_observations'][agent_id]
-        if observation['current_player'] == agent_id:
-          current_player_action = agent.act(observation)
-
-          # Playable now convention
-          if self.playable_now_convention_sim:
-            playable_now_action = Ruleset.playable_now_convention(observation)
-            if playable_now_action is not None:
-              current_player_action == playable_now_action
-
-      observations, reward, done, unused_info = self.environment.step(current_player_action)
+      agent_id = observation['current_player']
+      current_player_action = self._simulation_act(agent_id, self.agents[agent_id], observation)
+
+      # Playable now convention
+      if self.playable_now_convention_sim:
+        playable_now_action = Ruleset.playable_now_convention(observation)
+        if playable_now_action is not None:
+          current_player_action == playable_now_action
+
+      observation, reward, done, unused_info = self.environment.step_acting(current_player_action)
       if debug: print(f"mcts_agent.rollout_game: Agent {agent_id} completed action {current_player_action}")
       steps += 1
       #print(f"mcts_agent.simulate steps are {steps}")
       if not done:
         done = steps >= self.max_simulation_steps
 
-    return reward
+    # Value what the simulation left unplayed
+    self.leaf_value = 0
+    if self.leaf_evaluator is not None and not self.environment.state.is_terminal():
+      self.leaf_value = self.leaf_evaluator.value(self.environment.state, observation)
+    return reward + self.leaf_value
+
+  def _simulation_act(self, agent_id, agent, observation):
+    """Simulation agent's action, from the policy cache where its decisions are deterministic"""
+    if self.policy_cache is None or not hasattr(agent, 'decide'):
+      return agent.act(observation)
+    key = (agent_id, PolicyCache.key(observation))
+    action = self.policy_cache.get(key)
+    if action is None:
+      action, deterministic = agent.decide(observation)
+      if deterministic:
+        self.policy_cache.put(key, action)
+    return action
+
+  def _objective_rewards(self, leaf_value=0):
+    "Reward under each objective at the current forward model state, or None without objectives"
+    if not self.objectives:
+      return None
+    return [reward + leaf_value for reward in self.environment.rewards()]
 
-  def _backpropagate(self, path, reward):
-    "Send the reward back up to the ancestors of the leaf"
+  def _backpropagate(self, path, reward, rewards=None):
+    "Send the reward back up to the ancestors of the leaf. rewards: per objective, kept in Q_objectives"
     for node in reversed(path):
       self.N[node] += 1
       self.Q[node] += reward
+      if rewards is not None:
+        q = self.Q_objectives[node]
+        for objective, objective_reward in enumerate(rewards):
+          q[objective] += objective_reward
 
 
   def _uct_select(self, node):
@@ -427,9 +607,11 @@ class MCTSAgent(Agent):
   def _reset(self, state):
     self.player_id = state.cur_player()
     self.root_state = state.copy()
+    self.root_state.set_history_mode(self.history_mode)
     self.root_node = MCTSNode((), self.rules)
     self.children = dict()
     self.Q = defaultdict(int)
+    self.Q_objectives = defaultdict(lambda: [0] * len(self.objectives))
     self.N = defaultdict(int)
     self.N[self.root_node] = 0
     self.Q[self.root_node] = 0
@@ -23,14 +23,62 @@ class MCTSEnv(HanabiEnv):
     self.mcts_player = config['mcts_player']
     self.determine_type = config["determine_type"]
     self.score_type = config["score_type"]
+    # MB: When False, step only keeps what reward() reads: regret under ScoreType.REGRET, nothing otherwise
+    self.record_stats = config.get("record_stats", True)
+    # MB: Further score types evaluated by rewards(), alongside the one reward() returns
+    self.objectives = list(config.get("objectives", []))
+    self.track_regret = ScoreType.REGRET in [self.score_type] + self.objectives
     self.remember_hand = None
+    self.actioned_card = None
+    # MB: Times valid_hand had to restart a replacement hand, read by MCTSAgent's profiler
+    self.valid_hand_retries = 0
     self.determiniser = MCTSDeterminizer()
+    self._state = None
     super().__init__(config)
 
+  @property
+  def state(self):
+    return self._state
+
+  @state.setter
+  def state(self, state):
+    # MB: Rollout deals draw from this forward model's own game. On the real game's rng they would
+    # change the real game's later deals with the amount of searching done
+    if state is not None:
+      state.set_game(self.game)
+    self._state = state
+
   def reset(self, observations):
     self.record_moves.reset(observations)
 
   def step(self, action):
+    move, action_player = self._apply(action)
+    # Now make observation, as action player hand is restored and new player hand is redeterminised
+    observations = self._make_observation_all_players()
+    # Now move complete, update the stats record
+    self._record(move, observations["player_observations"][action_player], action_player)
+    reward = self.reward()
+    done = self.state.is_terminal()
+    info = {}
+    return (observations, reward, done, info)
+
+  def step_acting(self, action):
+    """step that builds only the observation of the player to act next, or of the acting player once
+    the game is over. RecordMoves reads public information only, so any player's observation serves it"""
+    move, action_player = self._apply(action)
+    done = self.state.is_terminal()
+    observation = self.acting_observation(action_player if done else None)
+    self._record(move, observation, action_player)
+    return (observation, self.reward(), done, {})
+
+  def acting_observation(self, player=None):
+    """Observation of player, by default the player to act"""
+    if player is None:
+      player = self.state.cur_player()
+    return self._extract_dict_from_backend(player, self.state.observation(player))
+
+  def _apply(self, action):
+    """Apply action and redeterminise hands as configured. Returns (move, action_player)"""
     debug = False
 
     # Convert action into HanabiMove
@@ -79,14 +127,16 @@ class MCTSEnv(HanabiEnv):
         if debug: print(f"mcts_env.step: Player {self.state.cur_player()} replaced hand")
 
     if debug: self.print_state()
-    # Now make observation, as action player hand is restored and new player hand is redeterminised
-    observations = self._make_observation_all_players()
-    # Now move complete, update the stats record
-    self.record_moves.update(move, observations["player_observations"][action_player], action_player, 0)
-    reward = self.reward()
-    done = self.state.is_terminal()
-    info = {}
-    return (observations, reward, done, info)
+    self.actioned_card = actioned_card
+    return move, action_player
+
+  def _record(self, move, observation, action_player):
+    """Update the stats record for move, keeping only what reward() needs unless record_stats"""
+    if self.record_stats:
+      self.record_moves.update(move, observation, action_player, 0)
+    elif self.track_regret:
+      self.record_moves.update_regret(move, observation, action_player
+                                      , self.actioned_card.to_dict() if self.actioned_card else None)
 
   def game_stats(self):
     return self.record_moves.game_stats
@@ -97,17 +147,24 @@ class MCTSEnv(HanabiEnv):
   def regret(self):
     return self.record_moves.regret()
 
-  def reward(self):
+  def reward(self, score_type=None):
     """Custom reward function for use during RIS-MCTS rollouts
     This is therefore not the same as the overall game score
+    score_type: defaults to the configured score_type
     """
-    if self.score_type == ScoreType.PROGRESS:
+    if score_type is None:
+      score_type = self.score_type
+    if score_type == ScoreType.PROGRESS:
       return self.progress()
-    elif self.score_type == ScoreType.REGRET:
+    elif score_type == ScoreType.REGRET:
       return self.progress() - self.regret()
     else:
       return self.score()
 
+  def rewards(self):
+    """Reward under each of the configured objectives, in order"""
+    return [self.reward(score_type) for score_type in self.objectives]
+
 
   def return_hand(self,player):
     """Return all cards from a player's hand to the deck
@@ -138,6 +195,7 @@ class MCTSEnv(HanabiEnv):
         # If there are no valid_cards, restart. Else, append to replacement_hand
         if not valid_card:
           if debug: print(f"mcts_env.valid_hand: Player {player} found broken replacement hand. Restarting.")
+          self.valid_hand_retries += 1
           break
         replacement_hand.append(valid_card)
 
@@ -238,12 +296,15 @@ class MCTSEnv(HanabiEnv):
 
 
 def make(environment_name="Hanabi-Full", num_players=2, mcts_player=0
-         , determine_type=0, score_type=0, pyhanabi_path=None):
+         , determine_type=0, score_type=0, record_stats=True, objectives=(), seed=-1, pyhanabi_path=None):
   """Make an environment.
 
   Args:
     environment_name: str, Name of the environment to instantiate.
     num_players: int, Number of players in this game.
+    record_stats: bool, Whether step keeps the full RecordMoves stats or only what reward() needs.
+    objectives: ScoreTypes evaluated by rewards() alongside score_type.
+    seed: int, Random seed for the deals of the forward model. -1 to use the system random device.
     pyhanabi_path: str, absolute path to header files for c code linkage.
 
   Returns:
@@ -274,6 +335,12 @@ def make(environment_name="Hanabi-Full", num_players=2, mcts_player=0
                 determine_type,
             "score_type":
                 score_type,
+            "record_stats":
+                record_stats,
+            "objectives":
+                objectives,
+            "seed":
+                seed,
             "max_information_tokens":
                 8,
             "max_life_tokens":
@@ -0,0 +1,55 @@
+# MB: Static leaf evaluation for MCTSAgent, used in place of (or after a shortened) _simulate
+import numpy as np
+
+
+class LinearEvaluator(object):
+  """Linear value function over cheap state features.
+  value() estimates the reward still to come from a state, so a leaf is worth reward() + value()"""
+
+  FEATURES = ('progress', 'life_tokens', 'information_tokens', 'deck_size', 'max_fireworks_slack', 'known_playable')
+
+  # Least squares fit to VanDenBerghAgent self-play (2-5 players, 400 games, r2 0.83), see benchmarks/leaf_evaluator.py --fit
+  DEFAULT_WEIGHTS = (-0.033, 0.603, 0.262, 0.108, 0.391, 0.643)
+  DEFAULT_BIAS = -1.766
+
+  def __init__(self, weights=DEFAULT_WEIGHTS, bias=DEFAULT_BIAS):
+    self.weights = np.asarray(weights, dtype=np.float64)
+    self.bias = float(bias)
+    if self.weights.shape != (len(self.FEATURES),):
+      raise ValueError(f"Expected {len(self.FEATURES)} weights, got {self.weights.shape}")
+
+  def __str__(self):
+    return 'LinearEvaluator'
+
+  def __repr__(self):
+    return str(self)
+
+  @staticmethod
+  def features(state, observation):
+    """Feature vector of state, in FEATURES order. observation: any player's observation of state"""
+    progress = state.progress()
+    fireworks = observation['fireworks']
+    known_playable = 0
+    for hand_knowledge in observation['card_knowledge']:
+      for knowledge in hand_knowledge:
+        rank = knowledge['rank']
+        if rank is None:
+          continue
+        color = knowledge['color']
+        if color is not None:
+          known_playable += fireworks[color] == rank
+        elif all(firework == rank for firework in fireworks.values()):
+          known_playable += 1
+    return np.array([progress, state.life_tokens(), state.information_tokens(), state.deck_size()
+                       , sum(observation['max_fireworks'].values()) - progress, known_playable], dtype=np.float64)
+
+  def value(self, state, observation):
+    return float(self.weights @ self.features(state, observation)) + self.bias
+
+  @classmethod
+  def fit(cls, features, targets):
+    """Least squares fit. features: (n, len(FEATURES)) array, targets: reward still to come from each state"""
+    features = np.asarray(features, dtype=np.float64)
+    design = np.hstack([features, np.ones((len(features), 1))])
+    solution = np.linalg.lstsq(design, np.asarray(targets, dtype=np.float64), rcond=None)[0]
+    return cls(solution[:-1], solution[-1])
@@ -1,5 +1,6 @@
 import random
 from abc import ABC, abstractmethod
+from collections import OrderedDict
 
 
 class Node(ABC):
@@ -91,3 +92,46 @@ class MCTSNode(Node):
     "Nodes must be comparable"
     # MB: Two nodes are equivalent if moves to get there are the same
     return node1.moves == node2.moves
+
+
+class InformationStateCache():
+  """Bounded LRU map keyed by an information state. Only valid for values that are a deterministic
+  function of what the acting player observes, as determinizations agreeing on it share the entry."""
+  def __init__(self, maxsize=4096):
+    self.maxsize = maxsize
+    self.entries = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+
+  @staticmethod
+  def key(observation):
+    """Acting player's information state: tokens, fireworks, hands with card knowledge, deck size and discards"""
+    return str(observation['pyhanabi'])
+
+  def get(self, key):
+    """Cached value for key, or None"""
+    value = self.entries.get(key)
+    if value is None:
+      self.misses += 1
+      return None
+    self.entries.move_to_end(key)
+    self.hits += 1
+    return value
+
+  def put(self, key, value):
+    self.entries[key] = value
+    self.entries.move_to_end(key)
+    if len(self.entries) > self.maxsize:
+      self.entries.popitem(last=False)
+
+  def stats(self):
+    return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries), 'maxsize': self.maxsize}
+
+
+class ChildrenCache(InformationStateCache):
+  """Deduplicated child moves found by deterministic rules at an information state"""
+
+
+class PolicyCache(InformationStateCache):
+  """Simulation agent decisions, keyed by (agent position, information state).
+  Only decisions an agent reports as deterministic are stored."""
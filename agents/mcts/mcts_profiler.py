@@ -0,0 +1,92 @@
+# MB: Opt-in per phase timing of MCTSAgent.act. NullProfiler stands in when profiling is off
+import time
+
+
+class NullProfiler(object):
+  """Profiler interface that records nothing"""
+
+  def start_move(self):
+    pass
+
+  def clear_move(self):
+    pass
+
+  def lap(self, phase):
+    pass
+
+  def count(self, counter, n=1):
+    pass
+
+  def depth(self, depth):
+    pass
+
+  def end_move(self):
+    pass
+
+  def move_stats(self):
+    return None
+
+  def stats(self):
+    return {}
+
+
+class SearchProfiler(NullProfiler):
+  """Wall time per search phase (ms) and search counters, for the last move and summed over all moves.
+  lap(phase) charges the time since the previous lap to phase, so the phases add up to the whole search"""
+
+  PHASES = ('determinize', 'select', 'replay', 'expand', 'simulate', 'backpropagate', 'choose')
+  COUNTERS = ('rollouts', 'replay_steps', 'valid_hand_retries', 'nodes_created', 'tree_depth')
+
+  def __init__(self):
+    self.move = None
+    self.totals = self._empty()
+    self.totals['searches'] = 0
+    self._clock = None
+
+  def _empty(self):
+    stats = {f'{phase}_ms': 0.0 for phase in self.PHASES}
+    stats.update(dict.fromkeys(self.COUNTERS, 0))
+    return stats
+
+  def start_move(self):
+    self.move = self._empty()
+    self._clock = time.perf_counter()
+
+  def clear_move(self):
+    """The move was decided without a search"""
+    self.move = None
+
+  def lap(self, phase):
+    now = time.perf_counter()
+    self.move[f'{phase}_ms'] += (now - self._clock) * 1000
+    self._clock = now
+
+  def count(self, counter, n=1):
+    self.move[counter] += n
+
+  def depth(self, depth):
+    """tree_depth is the deepest path selected in the move"""
+    self.move['tree_depth'] = max(self.move['tree_depth'], depth)
+
+  def end_move(self):
+    for key, value in self.move.items():
+      self.totals[key] += value
+    self.totals['searches'] += 1
+
+  def move_stats(self):
+    """The last move's phase times and counters"""
+    return self.move
+
+  def stats(self):
+    return dict(self.totals)
+
+  @classmethod
+  def breakdown(cls, stats):
+    """Share of search time per phase and per search means of the counters, from (summed) stats(), or None"""
+    if not stats.get('searches'):
+      return None
+    total = sum(stats[f'{phase}_ms'] for phase in cls.PHASES)
+    breakdown = {'search_ms': round(total / stats['searches'], 2)}
+    breakdown.update({phase: round(stats[f'{phase}_ms'] / total, 3) if total else 0 for phase in cls.PHASES})
+    breakdown.update({counter: round(stats[counter] / stats['searches'], 2) for counter in cls.COUNTERS})
+    return breakdown
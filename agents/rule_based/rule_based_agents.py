@@ -1,28 +1,42 @@
 from rl_env import Agent
-from agents.rule_based.ruleset import Ruleset
+from agents.rule_based.ruleset import Ruleset, RulePipeline
 # Agents originally sourced at https://github.com/rocanaan
 
 class RulebasedAgent(Agent):
   """Class of agents that follow rules"""
   def __init__(self,config,rules):
     self.rules = rules
+    self.pipeline = RulePipeline(rules)
     self.max_information_tokens = config.get('information_tokens', 8)
     self.totalCalls = 0
     self.histogram = [0 for i in range(len(rules) + 1)]
 
   def get_move(self, observation):
-    debug = True
+    return self.decide(observation)[0]
+
+  def decide(self, observation):
+    """(action, deterministic) where deterministic means the action follows from the observation alone:
+    it came from a rule before any that draws random numbers"""
     if observation['current_player_offset'] == 0:
-      for index, rule in enumerate(self.rules):
-        action = rule(observation)
-        if action is not None:
-          self.histogram[index] += 1
-          self.totalCalls += 1
-          return action
-      self.histogram[-1] += 1
+      index, action = self.pipeline.first(observation)
+      self.histogram[index] += 1
+      self.totalCalls += 1
+      if action is None:
+        return Ruleset.legal_random(observation), False
+      return action, index < self.pipeline.first_random
+    return None, True
+
+  def get_moves(self, observations):
+    """get_move over many observations, evaluating each rule across the batch (see RulePipeline.first_batch).
+    Decisions match get_move, except that rules drawing random numbers consume them in a different order."""
+    actions = [None] * len(observations)
+    acting = [i for i, observation in enumerate(observations) if observation['current_player_offset'] == 0]
+    decisions = self.pipeline.first_batch([observations[i] for i in acting])
+    for i, (index, action) in zip(acting, decisions):
+      self.histogram[index] += 1
       self.totalCalls += 1
-      return Ruleset.legal_random(observation)
-    return None
+      actions[i] = Ruleset.legal_random(observations[i]) if action is None else action
+    return actions
 
   def print_histogram(self):
     if self.totalCalls > 0:
@@ -31,6 +45,9 @@ class RulebasedAgent(Agent):
   def act(self, observation):
     return self.get_move(observation)
 
+  def act_batch(self, observations):
+    return self.get_moves(observations)
+
 
 class LegalRandomAgent(RulebasedAgent):
   """Chooses randomly from set of legal moves"""
@@ -83,93 +83,214 @@ def get_visible_cards(observation, player_offset):
   return visible_cards
 
 
+# Belief over a hand, shared by the probability rules and RulebasedAgent.act_batch.
+# Cards are indexed color * 5 + rank, colors in the order of `colors`.
+def _memoize(observation, key, compute):
+  """Cache compute() on observations that carry a features dict (see rl_env.LazyObservation)"""
+  features = getattr(observation, 'features', None)
+  if features is None:
+    return compute()
+  if key not in features:
+    features[key] = compute()
+  return features[key]
+
+
+def get_plausibility_mask(observation, player_offset=0):
+  """Array (hand_size, 25), True where a card in the hand could be that card"""
+  def compute():
+    card_knowledge = observation['pyhanabi'].card_knowledge()[player_offset]
+    mask = np.zeros((len(card_knowledge), 25), dtype=bool)
+    for hand_index, hidden_card in enumerate(card_knowledge):
+      color_plausible = [hidden_card.color_plausible(c) for c in range(5)]
+      rank_plausible = [hidden_card.rank_plausible(r) for r in range(5)]
+      mask[hand_index] = np.outer(color_plausible, rank_plausible).reshape(25)
+    return mask
+  return _memoize(observation, ('plausibility_mask', player_offset), compute)
+
+
+def get_unseen_counts(observation, player_offset=0):
+  """Array (25,) of the copies of each card not visible to player_offset"""
+  def compute():
+    counts = np.tile(num_in_deck_by_rank, 5)
+    for card in get_visible_cards(observation, player_offset):
+      counts[colors.index(card['color']) * 5 + card['rank']] -= 1
+    return counts
+  return _memoize(observation, ('unseen_counts', player_offset), compute)
+
+
+def get_card_belief(observation, player_offset=0):
+  """Belief matrix (hand_size, 25): unseen copies of each card where it is plausible, else 0.
+  Memoized on the observation. Returns it with the unseen counts (25,)"""
+  def compute():
+    counts = get_unseen_counts(observation, player_offset)
+    return get_plausibility_mask(observation, player_offset) * counts, counts
+  return _memoize(observation, ('card_belief', player_offset), compute)
+
+
+def _fireworks_array(observations, key='fireworks'):
+  """Fireworks dicts (or observation[key] fireworks dicts) as array (batch, 5)"""
+  return np.array([[(o if key is None else o[key])[color] for color in colors] for o in observations])
+
+
+def get_belief_batch(observations, player_offset=0):
+  """Stack belief matrices into (batch, max_hand_size, 25), with unseen counts (batch, 25).
+  Rows past the end of a shorter hand are all zero."""
+  beliefs = [get_card_belief(observation, player_offset) for observation in observations]
+  belief = np.zeros((len(observations), max(len(b) for b, _ in beliefs), 25), dtype=np.int64)
+  for index, (hand_belief, _) in enumerate(beliefs):
+    belief[index, :len(hand_belief)] = hand_belief
+  return belief, np.array([counts for _, counts in beliefs])
+
+
+def _probability_batch(belief, card_mask):
+  """Share of the belief on cards in card_mask (batch, 25). Padded rows are -1."""
+  total = belief.sum(axis=-1)
+  matching = (belief * card_mask[:, None, :]).sum(axis=-1)
+  probability = np.full(total.shape, -1.0)
+  np.divide(matching, total, out=probability, where=total > 0)
+  return probability
+
+
+def _playable_mask_batch(fireworks):
+  return (np.arange(5)[None, None, :] == fireworks[:, :, None]).reshape(-1, 25)
+
+
+def _useless_mask_batch(fireworks, max_fireworks):
+  ranks = np.arange(5)[None, None, :]
+  return ((ranks < fireworks[:, :, None]) | (ranks >= max_fireworks[:, :, None])).reshape(-1, 25)
+
+
 # This returns an array of the naive probability of each card being playable from a playable from a certain player's perspective
 # This ignores conventions, and also doesn't make any inferences based on the information the current player has on their hand
 def get_card_playability(observation, player_offset=0):
-  visible_cards = get_visible_cards(observation, player_offset)
-  my_hand_size = len(observation['observed_hands'][player_offset])
-  playability_array = np.zeros(my_hand_size)
-  for hand_index in range(my_hand_size):
-    total_possibilities = 0
-    playable_possibilities = 0
-    plausible_cards = get_plausible_cards(observation, player_offset, hand_index)
-    for plausible in plausible_cards:
-      num_in_deck = num_in_deck_by_rank[plausible.rank()]
-      for visible in visible_cards:
-        if visible['color'] == colors[plausible.color()] and visible['rank'] == plausible.rank():
-          num_in_deck -= 1
-      total_possibilities += num_in_deck
-      if playable_card(plausible, observation['fireworks']):
-        playable_possibilities += num_in_deck
-    playability_array[hand_index] = playable_possibilities / total_possibilities
-
-  return playability_array
+  def compute():
+    belief, _ = get_card_belief(observation, player_offset)
+    fireworks = _fireworks_array([observation])
+    return _probability_batch(belief[None], _playable_mask_batch(fireworks))[0]
+  return _memoize(observation, ('playability', player_offset), compute)
 
 def get_probability_useless(observation, player_offset=0):
-  visible_cards = get_visible_cards(observation, player_offset)
-  my_hand_size = len(observation['observed_hands'][player_offset])
-  probability_useless = np.zeros(my_hand_size)
-  max_fireworks = get_max_fireworks(observation)
-  for hand_index in range(my_hand_size):
-    total_possibilities = 0
-    useless_possibilities = 0
-    plausible_cards = get_plausible_cards(observation, player_offset, hand_index)
-    for plausible in plausible_cards:
-      num_in_deck = num_in_deck_by_rank[plausible.rank()]
-      for visible in visible_cards:
-        if visible['color'] == colors[plausible.color()] and visible['rank'] == plausible.rank():
-          num_in_deck -= 1
-      total_possibilities += num_in_deck
-      if useless_card(plausible, observation['fireworks'], max_fireworks):
-        useless_possibilities += num_in_deck
-    probability_useless[hand_index] = useless_possibilities / total_possibilities
-  return probability_useless
+  def compute():
+    belief, _ = get_card_belief(observation, player_offset)
+    fireworks = _fireworks_array([observation])
+    max_fireworks = _fireworks_array([get_max_fireworks(observation)], None)
+    return _probability_batch(belief[None], _useless_mask_batch(fireworks, max_fireworks))[0]
+  return _memoize(observation, ('useless', player_offset), compute)
 
 # MB: Added for use in RIS-MCTS discard
 # The probability useless counts cards that are not
 # This one computes probability that it is not a CRITICAL card, where critical means regret when discarding
 def get_probability_notcritical(observation, player_offset=0):
-  visible_cards = get_visible_cards(observation, player_offset)
-  my_hand_size = len(observation['observed_hands'][player_offset])
-  probability_useless = np.zeros(my_hand_size)
-  max_fireworks = get_max_fireworks(observation)
-  for hand_index in range(my_hand_size):
-    total_possibilities = 0
-    notcritical_possibilities = 0
-    plausible_cards = get_plausible_cards(observation, player_offset, hand_index)
-    for plausible in plausible_cards:
-      num_in_deck = num_in_deck_by_rank[plausible.rank()]
-      for visible in visible_cards:
-        if visible['color'] == colors[plausible.color()] and visible['rank'] == plausible.rank():
-          num_in_deck -= 1
-      total_possibilities += num_in_deck
-      if useless_card(plausible, observation['fireworks'], max_fireworks) or num_in_deck > 1:
-        notcritical_possibilities += num_in_deck
-    probability_useless[hand_index] = notcritical_possibilities / total_possibilities
-  return probability_useless
+  def compute():
+    belief, counts = get_card_belief(observation, player_offset)
+    fireworks = _fireworks_array([observation])
+    max_fireworks = _fireworks_array([get_max_fireworks(observation)], None)
+    notcritical = _useless_mask_batch(fireworks, max_fireworks) | (counts > 1)
+    return _probability_batch(belief[None], notcritical)[0]
+  return _memoize(observation, ('notcritical', player_offset), compute)
 
 # Note: Fireworks goes from 0 to 5, whereas rank goes from 0 to 4
+# Environment observations carry max_fireworks and discard_counts, maintained by the game state on each discard
 def get_max_fireworks(observation):
-  discarded_cards = {}
+  if 'max_fireworks' in observation:
+    return observation['max_fireworks']
+  return _memoize(observation, 'max_fireworks', lambda: _compute_max_fireworks(observation))
+
+
+def _compute_max_fireworks(observation):
   max_fireworks = {'R': 5, 'Y': 5, 'G': 5, 'W': 5, 'B': 5}
-  for card in observation['discard_pile']:
-    color = card['color']
-    rank = card['rank']
-    label = str(color) + str(rank)
-    if label not in discarded_cards:
-      discarded_cards[label] = 1
-    else:
-      discarded_cards[label] += 1
-  for label in discarded_cards:
-    color = label[0]
-    rank = int(label[1])
-    number_in_discard = discarded_cards[label]
-    if number_in_discard >= num_in_deck_by_rank[rank]:
-      if max_fireworks[color] >= rank:
-        max_fireworks[color] = rank
+  for color, counts in get_discard_counts(observation).items():
+    for rank, number_in_discard in enumerate(counts):
+      if number_in_discard >= num_in_deck_by_rank[rank]:
+        if max_fireworks[color] >= rank:
+          max_fireworks[color] = rank
   return max_fireworks
 
 
+def get_discard_counts(observation):
+  """Discarded copies of each card, as {color: [count by rank]}"""
+  if 'discard_counts' in observation:
+    return observation['discard_counts']
+  def compute():
+    counts = {color: [0] * 5 for color in colors}
+    for card in observation['discard_pile']:
+      counts[card['color']][card['rank']] += 1
+    return counts
+  return _memoize(observation, 'discard_counts', compute)
+
+
+class TeammateHints():
+  """Hint table for one teammate, from a single pass over their hand.
+  playable/useless/unplayable list card indices in hand order. touched maps each color and rank to the bitmask of the
+  hand slots a hint of it would touch (bit i is card i)."""
+  def __init__(self, player_offset, player_hand, player_hints, fireworks, max_fireworks):
+    self.player_offset = player_offset
+    self.cards = player_hand
+    self.hints = player_hints
+    self.playable, self.useless, self.unplayable = [], [], []
+    self.touched = {'color': {}, 'rank': {}}
+    color_touched, rank_touched = self.touched['color'], self.touched['rank']
+    for card_index, card in enumerate(player_hand):
+      color = card['color']
+      rank = card['rank']
+      bit = 1 << card_index
+      if rank == fireworks[color]:
+        self.playable.append(card_index)
+      elif rank < fireworks[color] or rank >= max_fireworks[color]:
+        self.useless.append(card_index)
+      else:
+        self.unplayable.append(card_index)
+      color_touched[color] = color_touched.get(color, 0) | bit
+      rank_touched[rank] = rank_touched.get(rank, 0) | bit
+
+  def action(self, attribute, card_index):
+    """REVEAL_COLOR ('color') or REVEAL_RANK ('rank') action touching the card at card_index"""
+    action_type = 'REVEAL_COLOR' if attribute == 'color' else 'REVEAL_RANK'
+    return {'action_type': action_type, attribute: self.cards[card_index][attribute], 'target_offset': self.player_offset}
+
+
+def get_teammate_hints(observation, player_offset):
+  """TeammateHints for the teammate at player_offset, built once per observation for the tell rules"""
+  def compute():
+    return TeammateHints(player_offset, observation['observed_hands'][player_offset],
+                         observation['card_knowledge'][player_offset], observation['fireworks'],
+                         get_max_fireworks(observation))
+  return _memoize(observation, ('hint_table', player_offset), compute)
+
+
+def get_hint_table(observation):
+  """Hint tables of the teammates, in offset order. Each is built when first reached, so rules stopping at
+  an earlier teammate do not pay for later ones."""
+  return (get_teammate_hints(observation, player_offset) for player_offset in range(1, observation['num_players']))
+
+
+def draws_random(rule):
+  """Decorator marking a rule whose action depends on the random module, not only the observation"""
+  rule.draws_random = True
+  return rule
+
+
+def get_card_playability_batch(observations, player_offset=0):
+  """get_card_playability for many observations, as (batch, max_hand_size)"""
+  belief, _ = get_belief_batch(observations, player_offset)
+  return _probability_batch(belief, _playable_mask_batch(_fireworks_array(observations)))
+
+
+def get_probability_useless_batch(observations, player_offset=0):
+  """get_probability_useless for many observations, as (batch, max_hand_size)"""
+  belief, _ = get_belief_batch(observations, player_offset)
+  max_fireworks = _fireworks_array([get_max_fireworks(o) for o in observations], None)
+  return _probability_batch(belief, _useless_mask_batch(_fireworks_array(observations), max_fireworks))
+
+
+def get_probability_notcritical_batch(observations, player_offset=0):
+  """get_probability_notcritical for many observations, as (batch, max_hand_size)"""
+  belief, counts = get_belief_batch(observations, player_offset)
+  max_fireworks = _fireworks_array([get_max_fireworks(o) for o in observations], None)
+  notcritical = _useless_mask_batch(_fireworks_array(observations), max_fireworks) | (counts > 1)
+  return _probability_batch(belief, notcritical)
+
+
 class Ruleset():
   #MB: For RIS-MCTS
   @staticmethod
@@ -226,17 +347,11 @@ class Ruleset():
         if rank < min(fireworks.values()):
           return {'action_type': 'DISCARD', 'card_index': card_index}
 
+    # A card is eventually playable if any plausible card has rank < max_fireworks[color]
+    eventually_playable = (np.arange(5)[None, :] < _fireworks_array([max_fireworks], None).T).reshape(25)
+    plausibility_mask = get_plausibility_mask(observation, 0)
     for card_index in range(len(observation['observed_hands'][0])):
-      plausible_cards = get_plausible_cards(observation, 0, card_index)
-      eventually_playable = False
-      for card in plausible_cards:
-        color = colors[card.color()]
-        rank = card.rank()
-        # if (rank>=fireworks[color] and rank<max_fireworks[color]):
-        if (rank < max_fireworks[color]):
-          eventually_playable = True
-          break
-      if not eventually_playable:
+      if not (plausibility_mask[card_index] & eventually_playable).any():
         return {'action_type': 'DISCARD', 'card_index': card_index}
     return None
 
@@ -256,6 +371,7 @@ class Ruleset():
 
   # Note: this rule only looks at the next player on purpose, for compatibility with the Fossgalaxy implementation. Prioritizes color
   @staticmethod
+  @draws_random
   def tell_randomly(observation):
     if observation['information_tokens'] > 0:
       PLAYER_OFFSET = 1
@@ -281,18 +397,28 @@ class Ruleset():
     PLAYER_OFFSET = 0
     fireworks = observation['fireworks']
 
+    playable = _playable_mask_batch(_fireworks_array([observation]))[0]
+    plausibility_mask = get_plausibility_mask(observation, PLAYER_OFFSET)
     for card_index, card in enumerate(observation['card_knowledge'][0]):
-      plausible_cards = get_plausible_cards(observation, PLAYER_OFFSET, card_index)
-      definetly_playable = True
-      for plausible in plausible_cards:
-        if not playable_card(plausible, fireworks):
-          definetly_playable = False
-          break
+      definetly_playable = not (plausibility_mask[card_index] & ~playable).any()
       if definetly_playable:
         action = {'action_type': 'PLAY', 'card_index': card_index}
         return action
     return None
 
+  @staticmethod
+  def play_safe_card_batch(observations):
+    masks = [get_plausibility_mask(observation) for observation in observations]
+    playable = _playable_mask_batch(_fireworks_array(observations))
+    actions = []
+    for mask, playable_cards in zip(masks, playable):
+      definetly_playable = ~(mask & ~playable_cards).any(axis=-1)
+      if definetly_playable.any():
+        actions.append({'action_type': 'PLAY', 'card_index': int(np.argmax(definetly_playable))})
+      else:
+        actions.append(None)
+    return actions
+
   @staticmethod
   def play_if_certain(observation):
     PLAYER_OFFSET = 0
@@ -308,27 +434,15 @@ class Ruleset():
   # Prioritizes Rank
   @staticmethod
   def tell_playable_card_outer(observation):
-    fireworks = observation['fireworks']
     # Check if it's possible to hint a card to your colleagues.
     if observation['information_tokens'] > 0:
       # Check if there are any playable cards in the hands of the opponents.
-      for player_offset in range(1, observation['num_players']):
-        player_hand = observation['observed_hands'][player_offset]
-        player_hints = observation['card_knowledge'][player_offset]
-        # Check if the card in the hand of the opponent is playable.
-        for card, hint in zip(player_hand, player_hints):
-          if playable_card(card, fireworks) and hint['rank'] is None:
-            return {
-              'action_type': 'REVEAL_RANK',
-              'rank': card['rank'],
-              'target_offset': player_offset
-            }
-          elif playable_card(card, fireworks) and hint['color'] is None:
-            return {
-              'action_type': 'REVEAL_COLOR',
-              'color': card['color'],
-              'target_offset': player_offset
-            }
+      for teammate in get_hint_table(observation):
+        for card_index in teammate.playable:
+          if teammate.hints[card_index]['rank'] is None:
+            return teammate.action('rank', card_index)
+          elif teammate.hints[card_index]['color'] is None:
+            return teammate.action('color', card_index)
     return None
 
   @staticmethod
@@ -341,31 +455,21 @@ class Ruleset():
   @staticmethod
   def tell_most_information_factory(consider_hints=False):
     def tell_most_information(observation):
-      fireworks = observation['fireworks']
       if observation['information_tokens'] > 0:
         max_affected = -1
         best_action = None
-        for player_offset in range(1, observation['num_players']):
-          player_hand = observation['observed_hands'][player_offset]
-          player_hints = observation['card_knowledge'][player_offset]
-          for card, hint in zip(player_hand, player_hints):
-            affected_colors = 0
-            affected_ranks = 0
-            for other_card in player_hand:
-              if card['color'] == other_card['color']:
-                affected_colors += 1
-                if consider_hints and hint['color'] is not None:
-                  affected_colors -= 1
-              if card['rank'] == other_card['rank']:
-                affected_ranks += 1
-                if consider_hints and hint['rank'] is not None:
-                  affected_ranks -= 1
+        for teammate in get_hint_table(observation):
+          color_touched = teammate.touched['color']
+          rank_touched = teammate.touched['rank']
+          for card_index, (card, hint) in enumerate(zip(teammate.cards, teammate.hints)):
+            affected_colors = 0 if consider_hints and hint['color'] is not None else bin(color_touched[card['color']]).count('1')
+            affected_ranks = 0 if consider_hints and hint['rank'] is not None else bin(rank_touched[card['rank']]).count('1')
             if affected_colors > max_affected:
               max_affected = affected_colors
-              best_action = {'action_type': 'REVEAL_COLOR', 'color': card['color'], 'target_offset': player_offset}
+              best_action = teammate.action('color', card_index)
             if affected_ranks > max_affected:
               max_affected = affected_ranks
-              best_action = {'action_type': 'REVEAL_RANK', 'rank': card['rank'], 'target_offset': player_offset}
+              best_action = teammate.action('rank', card_index)
         return best_action
       return None
     return tell_most_information
@@ -376,48 +480,42 @@ class Ruleset():
     def tell_dispensable(observation):
       if (observation['information_tokens'] < min_information_tokens):
         fireworks = observation['fireworks']
+        min_fireworks = min(fireworks.values())
         # Check if it's possible to hint a card to your colleagues.
         if observation['information_tokens'] > 0:
-          # Check if there are any playable cards in the hands of the opponents.
-          for player_offset in range(1, observation['num_players']):
-            player_hand = observation['observed_hands'][player_offset]
-            player_hints = observation['card_knowledge'][player_offset]
-            # Check if the card in the hand of the opponent is playable.
-            for card, hint in zip(player_hand, player_hints):
-              color = card['color']
-              rank = card['rank']
-              known_color = hint['color']
-              known_rank = hint['rank']
+          # Only cards already played can be identified this way, and those are useless
+          for teammate in get_hint_table(observation):
+            for card_index in teammate.useless:
+              color = teammate.cards[card_index]['color']
+              rank = teammate.cards[card_index]['rank']
+              known_color = teammate.hints[card_index]['color']
+              known_rank = teammate.hints[card_index]['rank']
               if known_color is None and fireworks[color] == 5:
-                return {'action_type': 'REVEAL_COLOR', 'color': color, 'target_offset': player_offset}
-              if known_rank is None and rank < min(fireworks.values()):
-                return {'action_type': 'REVEAL_RANK', 'rank': rank, 'target_offset': player_offset}
+                return teammate.action('color', card_index)
+              if known_rank is None and rank < min_fireworks:
+                return teammate.action('rank', card_index)
               if rank < fireworks[color]:
                 if known_color is None and known_rank is not None:
-                  return {'action_type': 'REVEAL_COLOR', 'color': color, 'target_offset': player_offset}
+                  return teammate.action('color', card_index)
                 if known_color is not None and known_rank is None:
-                  return {'action_type': 'REVEAL_RANK', 'rank': rank, 'target_offset': player_offset}
+                  return teammate.action('rank', card_index)
       return None
     return tell_dispensable
 
   @staticmethod
   def tell_anyone_useless_card(observation):
-    fireworks = observation['fireworks']
     if observation['information_tokens'] > 0:
-      max_fireworks = get_max_fireworks(observation)
-      for player_offset in range(1, observation['num_players']):
-        player_hand = observation['observed_hands'][player_offset]
-        player_hints = observation['card_knowledge'][player_offset]
-        for card, hint in zip(player_hand, player_hints):
-          if useless_card(card, fireworks, max_fireworks):
-            if hint['color'] is None:
-              return {'action_type': 'REVEAL_COLOR', 'color': card['color'], 'target_offset': player_offset}
-            if hint['rank'] is None:
-              return {'action_type': 'REVEAL_RANK', 'rank': card['rank'], 'target_offset': player_offset}
+      for teammate in get_hint_table(observation):
+        for card_index in teammate.useless:
+          if teammate.hints[card_index]['color'] is None:
+            return teammate.action('color', card_index)
+          if teammate.hints[card_index]['rank'] is None:
+            return teammate.action('rank', card_index)
     return None
 
   # Does not take into account what information the other player has into account, and decides whether to hint rank or color randomly
   @staticmethod
+  @draws_random
   def tell_playable_card(observation):
     fireworks = observation['fireworks']
     # Check if it's possible to hint a card to your colleagues.
@@ -444,6 +542,7 @@ class Ruleset():
     return None
 
   @staticmethod
+  @draws_random
   def legal_random(observation):
     """Act based on an observation."""
     if observation['current_player_offset'] == 0:
@@ -453,6 +552,7 @@ class Ruleset():
       return None
 
   @staticmethod
+  @draws_random
   def discard_randomly(observation):
     if observation['information_tokens'] < 8:
       player_offset = 0
@@ -473,6 +573,19 @@ class Ruleset():
           return action
       return None
 
+    def play_probably_safe_treshold_batch(observations):
+      playability = get_card_playability_batch(observations)
+      card_indices = np.argmax(playability, axis=1)
+      actions = []
+      for observation, playability_vector, card_index in zip(observations, playability, card_indices):
+        action = None
+        if not require_extra_lives or observation['life_tokens'] > 1:
+          if playability_vector[card_index] >= treshold:
+            action = {'action_type': 'PLAY', 'card_index': card_index}
+        actions.append(action)
+      return actions
+
+    play_probably_safe_treshold.batch = play_probably_safe_treshold_batch
     return play_probably_safe_treshold
 
   @staticmethod
@@ -485,14 +598,40 @@ class Ruleset():
           action = {'action_type': 'DISCARD', 'card_index': card_index}
           return action
       return None
+    discard_probably_useless_treshold.batch = Ruleset._discard_probably_useless_batch(treshold)
     return discard_probably_useless_treshold
 
+  @staticmethod
+  def _discard_probably_useless_batch(treshold):
+    def discard_probably_useless_treshold_batch(observations):
+      actions = [None] * len(observations)
+      indices = [i for i, observation in enumerate(observations) if observation['information_tokens'] < 8]
+      if indices:
+        probability_useless = get_probability_useless_batch([observations[i] for i in indices])
+        for i, probability_vector in zip(indices, probability_useless):
+          card_index = np.argmax(probability_vector)
+          if probability_vector[card_index] >= treshold:
+            actions[i] = {'action_type': 'DISCARD', 'card_index': card_index}
+      return actions
+    return discard_probably_useless_treshold_batch
+
   # "Hail Mary" rule used by agent Piers
   @staticmethod
   def hail_mary(observation):
     if (observation['deck_size'] == 0 and observation['life_tokens'] > 1):
       return Ruleset.play_probably_safe_factory(0.0)(observation)
 
+  @staticmethod
+  def hail_mary_batch(observations):
+    actions = [None] * len(observations)
+    indices = [i for i, observation in enumerate(observations)
+               if observation['deck_size'] == 0 and observation['life_tokens'] > 1]
+    if indices:
+      late_actions = Ruleset.play_probably_safe_factory(0.0).batch([observations[i] for i in indices])
+      for i, action in zip(indices, late_actions):
+        actions[i] = action
+    return actions
+
   @staticmethod
   def discard_probably_notcritical_factory(treshold=0.75):
     def discard_probably_useless_treshold(observation):
@@ -503,61 +642,39 @@ class Ruleset():
           action = {'action_type': 'DISCARD', 'card_index': card_index}
           return action
       return None
+    discard_probably_useless_treshold.batch = Ruleset._discard_probably_useless_batch(treshold)
     return discard_probably_useless_treshold
 
+  # Hint the missing color or rank of the first card in the given TeammateHints slots known by only one of them
+  @staticmethod
+  def _complete_tell(observation, slots):
+    if observation['information_tokens'] > 0:
+      for teammate in get_hint_table(observation):
+        for card_index in getattr(teammate, slots):
+          hint = teammate.hints[card_index]
+          if hint['color'] is None and hint['rank'] is not None:
+            return teammate.action('color', card_index)
+          if hint['rank'] is None and hint['color'] is not None:
+            return teammate.action('rank', card_index)
+    return None
+
   # MB: Added for RIS branching
   # Tell player who knows something about a playable card the remaining information
   @staticmethod
   def complete_tell_useful(observation):
-    fireworks = observation['fireworks']
-    if observation['information_tokens'] > 0:
-      max_fireworks = get_max_fireworks(observation)
-      for player_offset in range(1, observation['num_players']):
-        player_hand = observation['observed_hands'][player_offset]
-        player_hints = observation['card_knowledge'][player_offset]
-        for card, hint in zip(player_hand, player_hints):
-          if playable_card(card, fireworks):
-            if hint['color'] is None and hint['rank'] is not None:
-              return {'action_type': 'REVEAL_COLOR', 'color': card['color'], 'target_offset': player_offset}
-            if hint['rank'] is None and hint['color'] is not None:
-              return {'action_type': 'REVEAL_RANK', 'rank': card['rank'], 'target_offset': player_offset}
-    return None
+    return Ruleset._complete_tell(observation, 'playable')
 
   # MB: Added for RIS branching
   # Tell player who knows something about a discardabe card the remaining information
   @staticmethod
   def complete_tell_dispensable(observation):
-    fireworks = observation['fireworks']
-    if observation['information_tokens'] > 0:
-      max_fireworks = get_max_fireworks(observation)
-      for player_offset in range(1, observation['num_players']):
-        player_hand = observation['observed_hands'][player_offset]
-        player_hints = observation['card_knowledge'][player_offset]
-        for card, hint in zip(player_hand, player_hints):
-          if useless_card(card, fireworks, max_fireworks):
-            if hint['color'] is None and hint['rank'] is not None:
-              return {'action_type': 'REVEAL_COLOR', 'color': card['color'], 'target_offset': player_offset}
-            if hint['rank'] is None and hint['color'] is not None:
-              return {'action_type': 'REVEAL_RANK', 'rank': card['rank'], 'target_offset': player_offset}
-    return None
+    return Ruleset._complete_tell(observation, 'useless')
 
   # MB: Added for RIS branching
   # Tell player who knows something about a not playable, but not discardable card the remaining information
   @staticmethod
   def complete_tell_unplayable(observation):
-    fireworks = observation['fireworks']
-    if observation['information_tokens'] > 0:
-      max_fireworks = get_max_fireworks(observation)
-      for player_offset in range(1, observation['num_players']):
-        player_hand = observation['observed_hands'][player_offset]
-        player_hints = observation['card_knowledge'][player_offset]
-        for card, hint in zip(player_hand, player_hints):
-          if not useless_card(card, fireworks, max_fireworks) and not playable_card(card, fireworks):
-            if hint['color'] is None and hint['rank'] is not None:
-              return {'action_type': 'REVEAL_COLOR', 'color': card['color'], 'target_offset': player_offset}
-            if hint['rank'] is None and hint['color'] is not None:
-              return {'action_type': 'REVEAL_RANK', 'rank': card['rank'], 'target_offset': player_offset}
-    return None
+    return Ruleset._complete_tell(observation, 'unplayable')
 
   # MB: Added for RIS branching
   @staticmethod
@@ -565,6 +682,16 @@ class Ruleset():
     def play_probably_safe_late(observation):
       if observation["deck_size"] <= deck_size:
         return Ruleset.play_probably_safe_factory(treshold)(observation)
+    def play_probably_safe_late_batch(observations):
+      actions = [None] * len(observations)
+      indices = [i for i, observation in enumerate(observations) if observation["deck_size"] <= deck_size]
+      if indices:
+        late_actions = Ruleset.play_probably_safe_factory(treshold).batch([observations[i] for i in indices])
+        for i, action in zip(indices, late_actions):
+          actions[i] = action
+      return actions
+
+    play_probably_safe_late.batch = play_probably_safe_late_batch
     return play_probably_safe_late
 
   # MB: Discard a definite safe card. If not discard card most confident is not critical
@@ -580,3 +707,73 @@ class Ruleset():
     return action
 
 
+# Batched versions of static rules, picked up by RulebasedAgent.act_batch
+Ruleset.play_safe_card.batch = Ruleset.play_safe_card_batch
+Ruleset.hail_mary.batch = Ruleset.hail_mary_batch
+
+
+class FeatureObservation(dict):
+  """Plain observation dict with a features cache, so rules can share features on it"""
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.features = {}
+
+
+class RulePipeline():
+  """Ordered rules compiled for an agent.
+  Rules read shared features (belief, playability, hint tables...) through the memoized getters on the
+  observation prepare() returns, so each is computed at most once per decision, and only if a rule
+  that needs it is reached.
+  first_random is the index of the first rule drawing random numbers (len(rules) if none), so a
+  decision by an earlier rule depends on the observation alone."""
+  def __init__(self, rules):
+    self.rules = list(rules)
+    self.first_random = next((index for index, rule in enumerate(self.rules)
+                              if getattr(rule, 'draws_random', False)), len(self.rules))
+
+  def __len__(self):
+    return len(self.rules)
+
+  @staticmethod
+  def prepare(observation):
+    """Observation with a features cache, wrapping plain dicts"""
+    if getattr(observation, 'features', None) is None:
+      return FeatureObservation(observation)
+    return observation
+
+  def first(self, observation):
+    """(index, action) of the first rule returning an action, or (len(rules), None)"""
+    observation = self.prepare(observation)
+    for index, rule in enumerate(self.rules):
+      action = rule(observation)
+      if action is not None:
+        return index, action
+    return len(self.rules), None
+
+  def all(self, observation):
+    """Action of every rule on the observation, None where a rule does not apply"""
+    observation = self.prepare(observation)
+    return [rule(observation) for rule in self.rules]
+
+  def first_batch(self, observations):
+    """first over many observations, evaluating each rule across every observation still undecided.
+    Rules with a `batch` attribute use array ops, others are called per observation."""
+    observations = [self.prepare(observation) for observation in observations]
+    decisions = [(len(self.rules), None)] * len(observations)
+    pending = list(range(len(observations)))
+    for index, rule in enumerate(self.rules):
+      if not pending:
+        break
+      batch_rule = getattr(rule, 'batch', None)
+      if batch_rule is not None:
+        rule_actions = batch_rule([observations[i] for i in pending])
+      else:
+        rule_actions = [rule(observations[i]) for i in pending]
+      undecided = []
+      for i, action in zip(pending, rule_actions):
+        if action is None:
+          undecided.append(i)
+        else:
+          decisions[i] = (index, action)
+      pending = undecided
+    return decisions
@@ -0,0 +1,111 @@
+# MB: Score and speed of MCTSAgent with the static leaf evaluator against full simulation.
+# Player 0 is the MCTSAgent under test and the rest are VanDenBerghAgents. Every mcts type plays
+# the same seeded deals. --fit refits LinearEvaluator on VanDenBerghAgent self-play instead.
+#
+#   PYTHONPATH=. python benchmarks/leaf_evaluator.py --players 3 --games 10 --mcts_types 0 A B
+#   PYTHONPATH=. python benchmarks/leaf_evaluator.py --fit --games 100
+
+import argparse
+import math
+import time
+
+import numpy as np
+
+import rl_env
+from agents.mcts.mcts_agent import MCTSAgent
+from agents.mcts.mcts_evaluator import LinearEvaluator
+from agents.rule_based.rule_based_agents import VanDenBerghAgent
+
+
+def make_env(players, seed):
+  config = rl_env.make_config('Hanabi-Full', players)
+  config['seed'] = seed
+  return rl_env.HanabiEnv(config)
+
+
+def collect(players, games, seed):
+  """Features of every state in VanDenBerghAgent self-play, with the score still to come"""
+  env = make_env(players, seed)
+  agents = [VanDenBerghAgent({'players': players}) for _ in range(players)]
+  features = []
+  targets = []
+  for _ in range(games):
+    observations = env.reset()
+    game_features = []
+    game_scores = []
+    done = False
+    while not done:
+      player = observations['current_player']
+      observation = observations['player_observations'][player]
+      game_features.append(LinearEvaluator.features(env.state, observation))
+      game_scores.append(env.state.score())
+      observations, _, done, _ = env.step(agents[player].act(observation))
+    features += game_features
+    targets += [env.state.score() - score for score in game_scores]
+  return features, targets
+
+
+def fit(args):
+  features = []
+  targets = []
+  for players in args.players:
+    player_features, player_targets = collect(players, args.games, args.seed)
+    features += player_features
+    targets += player_targets
+  evaluator = LinearEvaluator.fit(features, targets)
+  targets = np.asarray(targets)
+  predictions = np.asarray(features) @ evaluator.weights + evaluator.bias
+  r2 = 1 - ((targets - predictions) ** 2).sum() / ((targets - targets.mean()) ** 2).sum()
+  print(f"states={len(targets)} r2={r2:.3f}")
+  print(f"DEFAULT_WEIGHTS = ({', '.join(f'{w:.3f}' for w in evaluator.weights)})")
+  print(f"DEFAULT_BIAS = {evaluator.bias:.3f}")
+
+
+def evaluate(players, mcts_type, games, seed):
+  """Returns (scores, rollouts, search seconds) for MCTSAgent of mcts_type in player 0"""
+  env = make_env(players, seed)
+  config = {'players': players, 'mcts_types': mcts_type + '0' * (players - 1)}
+  agent = MCTSAgent(dict(config, player_id=0))
+  teammates = [VanDenBerghAgent(config) for _ in range(players)]
+  scores = []
+  search_time = 0
+  for _ in range(games):
+    observations = env.reset()
+    done = False
+    while not done:
+      player = observations['current_player']
+      observation = observations['player_observations'][player]
+      if player == 0:
+        start = time.perf_counter()
+        action = agent.act(observation, env.state)
+        search_time += time.perf_counter() - start
+      else:
+        action = teammates[player].act(observation)
+      observations, _, done, _ = env.step(action)
+    scores.append(env.state.score())
+  rollouts = agent.stats()['searched'] * agent.max_rollout_num
+  return scores, rollouts, search_time
+
+
+def main():
+  parser = argparse.ArgumentParser(description="MCTSAgent leaf evaluator against full simulation")
+  parser.add_argument('--players', type=int, nargs='+', default=[3])
+  parser.add_argument('--games', type=int, default=10)
+  parser.add_argument('--seed', type=int, default=1)
+  parser.add_argument('--mcts_types', nargs='+', default=['0', 'A', 'B'])
+  parser.add_argument('--fit', action='store_true', help="Refit LinearEvaluator weights on VanDenBerghAgent self-play")
+  args = parser.parse_args()
+
+  if args.fit:
+    fit(args)
+    return
+  print("players mcts_type  avg_score  stderr  rollouts/s")
+  for players in args.players:
+    for mcts_type in args.mcts_types:
+      scores, rollouts, search_time = evaluate(players, mcts_type, args.games, args.seed)
+      stderr = np.std(scores, ddof=1) / math.sqrt(len(scores)) if len(scores) > 1 else float('nan')
+      print(f"{players:7d} {mcts_type:9s} {np.mean(scores):10.2f} {stderr:7.2f} {rollouts / search_time:11.0f}")
+
+
+if __name__ == "__main__":
+  main()
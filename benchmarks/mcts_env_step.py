@@ -0,0 +1,77 @@
+# MB: Times MCTSEnv.step with the full RecordMoves stats against the stats-free rollout mode.
+# Both environments share the game seed and the random move sequence, so they play identical games
+# and must return identical rewards.
+#
+#   PYTHONPATH=. python benchmarks/mcts_env_step.py --players 2 3 4 5 --games 50
+
+import argparse
+import random
+import time
+
+import pyhanabi
+from agents.mcts import mcts_env
+
+
+def make_env(players, score_type, determine_type, record_stats, seed):
+  return mcts_env.MCTSEnv(config={"colors": 5, "ranks": 5, "players": players, "mcts_player": 0,
+                                  "determine_type": determine_type, "score_type": score_type,
+                                  "record_stats": record_stats, "max_information_tokens": 8,
+                                  "max_life_tokens": 3, "seed": seed,
+                                  "observation_type": pyhanabi.AgentObservationType.CARD_KNOWLEDGE.value})
+
+
+def play(env, games, seed):
+  """Play random legal games. Returns (step seconds, steps, rewards)"""
+  rng = random.Random(seed)
+  # Determinization draws from the global random module
+  random.seed(seed)
+  elapsed = 0
+  steps = 0
+  rewards = []
+  for _ in range(games):
+    env.state = env.game.new_initial_state()
+    while env.state.cur_player() == pyhanabi.CHANCE_PLAYER_ID:
+      env.state.deal_random_card()
+    observations = env._make_observation_all_players()
+    env.reset(observations["player_observations"][env.state.cur_player()])
+    env.remember_hand = env.state.player_hands()[env.state.cur_player()]
+    done = False
+    while not done:
+      move = rng.choice(env.state.legal_moves())
+      start = time.perf_counter()
+      observations, reward, done, _ = env.step(move)
+      elapsed += time.perf_counter() - start
+      steps += 1
+      rewards.append(reward)
+  return elapsed, steps, rewards
+
+
+def main():
+  parser = argparse.ArgumentParser(description="MCTSEnv.step with and without RecordMoves stats")
+  parser.add_argument('--players', type=int, nargs='+', default=[2, 3, 4, 5])
+  parser.add_argument('--games', type=int, default=50)
+  parser.add_argument('--seed', type=int, default=1)
+  parser.add_argument('--repeats', type=int, default=3, help="Best of this many timings per mode")
+  parser.add_argument('--determine_type', type=int, default=int(mcts_env.DetermineType.NONE))
+  args = parser.parse_args()
+
+  print("players score_type  stats_us  fast_us  saved")
+  for players in args.players:
+    for score_type in mcts_env.ScoreType:
+      results = {True: None, False: None}
+      for _ in range(args.repeats):
+        # Alternate the modes so drift in machine load hits both alike
+        for record_stats in (True, False):
+          env = make_env(players, score_type, args.determine_type, record_stats, args.seed)
+          result = play(env, args.games, args.seed)
+          if results[record_stats] is None or result[0] < results[record_stats][0]:
+            results[record_stats] = result
+      (full_time, steps, full_rewards), (fast_time, _, fast_rewards) = results[True], results[False]
+      assert full_rewards == fast_rewards, "stats-free step changed the rewards"
+      full_us = full_time / steps * 1e6
+      fast_us = fast_time / steps * 1e6
+      print(f"{players:7d} {score_type.name:10s} {full_us:9.1f} {fast_us:8.1f} {1 - fast_us / full_us:6.1%}")
+
+
+if __name__ == "__main__":
+  main()
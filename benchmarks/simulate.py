@@ -0,0 +1,96 @@
+# MB: Times MCTSAgent._simulate, which builds and consults only the acting player's observation,
+# against the previous loop that built every player's observation and asked every agent each step.
+# Both run from the same seeded mid-game states of VanDenBerghAgent self-play.
+#
+#   PYTHONPATH=. python benchmarks/simulate.py --players 2 3 4 5
+
+import argparse
+import random
+import time
+
+import rl_env
+from agents.mcts import mcts_env
+from agents.mcts.mcts_agent import MCTSAgent
+from agents.mcts.mcts_node import MCTSNode
+from agents.rule_based.rule_based_agents import VanDenBerghAgent
+
+
+def simulate_all_players(agent, node):
+  """The previous _simulate loop: every player's observation each step, every agent asked"""
+  environment = agent.environment
+  environment.state = node.focused_state
+  observations = environment._make_observation_all_players()
+  done = node.is_terminal()
+  reward = environment.reward()
+  steps = 0
+  while not done and steps < agent.max_simulation_steps:
+    for agent_id, simulation_agent in enumerate(agent.agents):
+      observation = observations['player_observations'][agent_id]
+      if observation['current_player'] == agent_id:
+        current_player_action = simulation_agent.act(observation)
+    observations, reward, done, unused_info = environment.step(current_player_action)
+    steps += 1
+    if not done:
+      done = steps >= agent.max_simulation_steps
+  return reward
+
+
+def mid_game_states(players, count, seed):
+  """(env, states) of player 0 to act, sampled from VanDenBerghAgent self-play.
+  The states point at env's game, so env has to outlive them"""
+  config = rl_env.make_config('Hanabi-Full', players)
+  config['seed'] = seed
+  env = rl_env.HanabiEnv(config)
+  agents = [VanDenBerghAgent({'players': players}) for _ in range(players)]
+  states = []
+  while len(states) < count:
+    observations = env.reset()
+    done = False
+    while not done and len(states) < count:
+      player = observations['current_player']
+      if player == 0:
+        states.append(env.state.copy())
+      observations, _, done, _ = env.step(agents[player].act(observations['player_observations'][player]))
+  return env, states
+
+
+def time_simulations(agent, states, simulate, seed):
+  random.seed(seed)
+  elapsed = 0
+  for state in states:
+    # Master determinisation, as in MCTSAgent.act
+    agent.environment.state = state.copy()
+    agent.environment.replace_hand(0)
+    node = MCTSNode((), agent.rules)
+    node.focused_state = agent.environment.state
+    agent.environment.reset(agent.environment.acting_observation())
+    start = time.perf_counter()
+    simulate(node)
+    elapsed += time.perf_counter() - start
+  return elapsed / len(states)
+
+
+def main():
+  parser = argparse.ArgumentParser(description="_simulate against the all players simulation loop")
+  parser.add_argument('--players', type=int, nargs='+', default=[2, 3, 4, 5])
+  parser.add_argument('--states', type=int, default=200)
+  parser.add_argument('--seed', type=int, default=1)
+  parser.add_argument('--repeats', type=int, default=3, help="Best of this many timings per loop")
+  parser.add_argument('--determine_type', type=int, default=int(mcts_env.DetermineType.RESTORE))
+  args = parser.parse_args()
+
+  print("players  all_players_us  acting_us  speedup")
+  for players in args.players:
+    env, states = mid_game_states(players, args.states, args.seed)
+    agent = MCTSAgent({'players': players, 'player_id': 0, 'mcts_types': '0' * players})
+    agent.max_simulation_steps = players
+    agent.environment.determine_type = args.determine_type
+    all_players = acting = float('inf')
+    for _ in range(args.repeats):
+      all_players = min(all_players, time_simulations(agent, states, lambda node: simulate_all_players(agent, node), args.seed))
+      acting = min(acting, time_simulations(agent, states, agent._simulate, args.seed))
+    print(f"{players:7d} {all_players * 1e6:15.0f} {acting * 1e6:10.0f} {all_players / acting:8.2f}x")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,278 @@
+# MB: Microbenchmarks of the search hot paths, compared against a stored baseline.
+# Every benchmark runs over the saved mid-game states in benchmarks/states.json, replayed from their
+# seeds, and reseeds the random module first, so runs are repeatable. Results are us per operation.
+#
+#   PYTHONPATH=. python benchmarks/suite.py                      # Run and compare to benchmarks/baseline.json
+#   PYTHONPATH=. python benchmarks/suite.py --output results.json --filter state_copy legal_moves
+#   PYTHONPATH=. python benchmarks/suite.py --save_baseline      # Store this run as the baseline
+#   PYTHONPATH=. python benchmarks/suite.py --save_states        # Regenerate benchmarks/states.json
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+import rl_env
+from agents.mcts import mcts_env
+from agents.mcts.mcts_agent import MCTSAgent
+from agents.rule_based import ruleset
+from agents.rule_based.rule_based_agents import VanDenBerghAgent
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+STATES_PATH = os.path.join(HERE, 'states.json')
+BASELINE_PATH = os.path.join(HERE, 'baseline.json')
+
+
+def save_states(path=STATES_PATH, players=(2, 3, 4, 5), games=4, moves=(8, 24, 40)):
+  """Record mid-game states of seeded VanDenBerghAgent self-play, as the actions leading to them"""
+  states = []
+  for num_players in players:
+    for seed in range(games):
+      random.seed(seed)
+      env = rl_env.make('Hanabi-Full', num_players=num_players, seed=seed)
+      agents = [VanDenBerghAgent({'players': num_players}) for _ in range(num_players)]
+      observations = env.reset()
+      actions = []
+      done = False
+      while not done and len(actions) < max(moves):
+        player = observations['current_player']
+        action = agents[player].act(observations['player_observations'][player])
+        actions.append(action)
+        observations, _, done, _ = env.step(action)
+        if len(actions) in moves and not done:
+          states.append({'players': num_players, 'seed': seed, 'actions': list(actions)})
+  with open(path, 'w') as states_file:
+    # MB: Card indices can come back as numpy ints
+    json.dump(states, states_file, indent=0, default=int)
+  print(f"Saved {len(states)} states to {path}")
+
+
+def load_states(path=STATES_PATH):
+  """{players: [(env, state)]} replayed from the saved actions. Each state points at its env's game,
+  so the envs are kept alongside"""
+  with open(path) as states_file:
+    saved = json.load(states_file)
+  states = {}
+  for entry in saved:
+    env = rl_env.make('Hanabi-Full', num_players=entry['players'], seed=entry['seed'])
+    env.reset()
+    for action in entry['actions']:
+      env.step(action)
+    states.setdefault(entry['players'], []).append((env, env.state.copy()))
+  return states
+
+
+def observe(env, state):
+  """Fresh observation of state by the player to act, without any memoized features"""
+  player = state.cur_player()
+  return env._extract_dict_from_backend(player, state.observation(player))
+
+
+def time_ops(setup, operation, states, seed, number=1):
+  """Mean us per operation over states. setup(env, state) builds the operation's argument outside the timing.
+  Operations that leave their argument unchanged can run number times per state"""
+  random.seed(seed)
+  elapsed = 0
+  for env, state in states:
+    argument = setup(env, state)
+    start = time.perf_counter()
+    for _ in range(number):
+      operation(argument)
+    elapsed += time.perf_counter() - start
+  return elapsed / (len(states) * number) * 1e6
+
+
+def forward_model(players, state, determine_type=mcts_env.DetermineType.RESTORE):
+  environment = mcts_env.make('Hanabi-Full', num_players=players, mcts_player=state.cur_player()
+                              , determine_type=determine_type, record_stats=False, seed=1)
+  environment.state = state.copy()
+  return environment
+
+
+def next_player(state):
+  return (state.cur_player() + 1) % state.num_players()
+
+
+def bench_state_copy(players, states, args):
+  return time_ops(lambda env, state: state, lambda state: state.copy(), states, args.seed, number=100)
+
+
+def bench_legal_moves(players, states, args):
+  return time_ops(lambda env, state: state, lambda state: state.legal_moves(), states, args.seed
+                  , number=20)
+
+
+def bench_mcts_env_step(players, states, args):
+  """Forward model step of the player to act, including redeterminising the next player's hand"""
+  def setup(env, state):
+    environment = forward_model(players, state)
+    return environment, state.legal_moves()[0]
+  return time_ops(setup, lambda argument: argument[0].step(argument[1]), states, args.seed)
+
+
+def bench_replace_hand(players, states, args):
+  def setup(env, state):
+    return forward_model(players, state), next_player(state)
+  return time_ops(setup, lambda argument: argument[0].replace_hand(argument[1]), states, args.seed)
+
+
+def bench_restore_hand(players, states, args):
+  def setup(env, state):
+    environment = forward_model(players, state)
+    player = next_player(state)
+    remember_hand = environment.state.player_hands()[player]
+    environment.replace_hand(player)
+    return environment, player, remember_hand
+  return time_ops(setup, lambda argument: argument[0].restore_hand(argument[1], argument[2]), states
+                  , args.seed)
+
+
+def bench_valid_cards(players, states, args):
+  """Candidate cards for the first slot of the next player's hand"""
+  def setup(env, state):
+    environment = forward_model(players, state)
+    player = next_player(state)
+    # The card knowledge points into the observation, so it has to be kept alive too
+    observation = state.observation(player)
+    return (environment.determiniser, player, state.player_hands(), state.discard_pile(), state.fireworks()
+            , observation.card_knowledge()[0], observation)
+  def operation(argument):
+    determiniser, player, hands, discard_pile, fireworks, card_knowledge, _ = argument
+    determiniser.valid_cards(player, 0, hands, discard_pile, fireworks, card_knowledge)
+  return time_ops(setup, operation, states, args.seed, number=20)
+
+
+def bench_card_playability(players, states, args):
+  return time_ops(observe, ruleset.get_card_playability, states, args.seed)
+
+
+def bench_probability_useless(players, states, args):
+  return time_ops(observe, ruleset.get_probability_useless, states, args.seed)
+
+
+def bench_vdb_act(players, states, args):
+  agent = VanDenBerghAgent({'players': players})
+  return time_ops(observe, agent.act, states, args.seed)
+
+
+def bench_mcts_act(mcts_type):
+  def bench(players, states, args):
+    """Full MCTSAgent.act for the player to act, on the first few states"""
+    def setup(env, state):
+      player = state.cur_player()
+      agent = MCTSAgent({'players': players, 'player_id': player, 'mcts_types': mcts_type * players, 'seed': args.seed})
+      return agent, observe(env, state), state
+    return time_ops(setup, lambda argument: argument[0].act(argument[1], argument[2]), states[:args.mcts_states]
+                    , args.seed)
+  return bench
+
+
+BENCHMARKS = {'state_copy': bench_state_copy, 'legal_moves': bench_legal_moves, 'mcts_env_step': bench_mcts_env_step
+              , 'replace_hand': bench_replace_hand, 'restore_hand': bench_restore_hand, 'valid_cards': bench_valid_cards
+              , 'card_playability': bench_card_playability, 'probability_useless': bench_probability_useless
+              , 'vdb_act': bench_vdb_act}
+
+
+def calibrate(repeats=5):
+  """us for a fixed pure Python workload, best of repeats. It touches no repo code, so it tracks the speed
+  of the machine and interpreter rather than of the tree, and compare scales the baseline by it"""
+  best = float('inf')
+  for _ in range(repeats):
+    rng = random.Random(0)
+    start = time.perf_counter()
+    values = [rng.randrange(1000) for _ in range(20000)]
+    counts = {}
+    for value in values:
+      counts[value] = counts.get(value, 0) + 1
+    sorted(values)
+    [str(value) for value in values[:5000]]
+    best = min(best, time.perf_counter() - start)
+  return best * 1e6
+
+
+def run(args):
+  states = load_states()
+  benchmarks = dict(BENCHMARKS)
+  for mcts_type in args.mcts_types:
+    benchmarks[f'mcts_act_{mcts_type}'] = bench_mcts_act(mcts_type)
+  if args.filter:
+    benchmarks = {name: bench for name, bench in benchmarks.items() if any(f in name for f in args.filter)}
+  # MB: Repeats go round every benchmark in turn, so a slow spell of the machine costs one repeat of
+  # several benchmarks rather than every repeat of one
+  results = {}
+  calibration = calibrate()
+  for _ in range(args.repeats):
+    for name, bench in benchmarks.items():
+      for players in args.players:
+        key = f'{name}/p{players}'
+        results[key] = min(results.get(key, float('inf')), bench(players, states[players], args))
+  for key, value in results.items():
+    print(f"{key:28s} {value:12.1f} us")
+  return {'meta': {'date': datetime.datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version()
+                   , 'machine': platform.machine(), 'seed': args.seed, 'repeats': args.repeats
+                   , 'calibration_us': min(calibration, calibrate())}
+          , 'results': results}
+
+
+def compare(results, baseline, threshold):
+  """Names of benchmarks slower than baseline by more than threshold times, printing every ratio.
+  Baseline times are first scaled by how much slower this run's calibration loop was than the baseline's"""
+  scale = results['meta']['calibration_us'] / baseline['meta']['calibration_us']
+  print(f"calibration {baseline['meta']['calibration_us']:.0f} us baseline, {results['meta']['calibration_us']:.0f} us now"
+        f", baseline scaled by {scale:.2f}")
+  regressions = []
+  print(f"{'benchmark':28s} {'baseline_us':>12s} {'us':>12s} {'ratio':>7s}")
+  for key, value in results['results'].items():
+    if key not in baseline['results']:
+      continue
+    expected = baseline['results'][key] * scale
+    ratio = value / expected
+    flag = ' REGRESSION' if ratio > threshold else ''
+    print(f"{key:28s} {expected:12.1f} {value:12.1f} {ratio:7.2f}{flag}")
+    if ratio > threshold:
+      regressions.append(key)
+  return regressions
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Search hot path microbenchmarks")
+  parser.add_argument('--players', type=int, nargs='+', default=[2, 3, 4, 5])
+  parser.add_argument('--mcts_types', nargs='+', default=['0', '1'])
+  parser.add_argument('--mcts_states', type=int, default=2, help="States per player count timed for MCTSAgent.act")
+  parser.add_argument('--filter', nargs='+', help="Only benchmarks whose name contains one of these")
+  parser.add_argument('--repeats', type=int, default=3, help="Best of this many passes over the states")
+  parser.add_argument('--seed', type=int, default=1)
+  parser.add_argument('--output', help="Write results as JSON")
+  parser.add_argument('--baseline', default=BASELINE_PATH)
+  parser.add_argument('--threshold', type=float, default=1.5, help="Slowdown ratio that counts as a regression")
+  parser.add_argument('--save_baseline', action='store_true', help="Store this run as the baseline")
+  parser.add_argument('--save_states', action='store_true', help="Regenerate the saved states and exit")
+  args = parser.parse_args()
+
+  if args.save_states:
+    save_states()
+    return
+  results = run(args)
+  if args.output:
+    with open(args.output, 'w') as output:
+      json.dump(results, output, indent=1)
+  if args.save_baseline:
+    with open(args.baseline, 'w') as output:
+      json.dump(results, output, indent=1)
+    return
+  if os.path.exists(args.baseline):
+    with open(args.baseline) as baseline_file:
+      baseline = json.load(baseline_file)
+    if 'calibration_us' not in baseline['meta']:
+      sys.exit(f"{args.baseline} has no calibration to compare across machines, store one with --save_baseline")
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+      sys.exit(f"{len(regressions)} regressions over {args.threshold}x: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+  main()
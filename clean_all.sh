@@ -20,4 +20,4 @@ then
   make clean
 fi
 
-rm -rf *.pyc agents/*.pyc __pycache__ agents/__pycache__ CMakeCache.txt CMakeFiles Makefile cmake_install.cmake  hanabi_lib/CMakeFiles hanabi_lib/Makefile hanabi_lib/cmake_install.cmake
+rm -rf *.pyc agents/*.pyc __pycache__ agents/__pycache__ CMakeCache.txt CMakeFiles Makefile cmake_install.cmake  hanabi_lib/CMakeFiles hanabi_lib/Makefile hanabi_lib/cmake_install.cmake _pyhanabi*.so
@@ -0,0 +1,175 @@
+# Streaming experiment results: one record per finished episode, flushed as it is written,
+# so a run that is stopped part way still leaves every finished episode on disk
+import csv
+import json
+import os
+
+
+def make_results_writer(path):
+  """Results writer for path: CSV for a .csv file, JSON lines otherwise"""
+  if os.path.splitext(path)[1].lower() == '.csv':
+    return CsvResultsWriter(path)
+  return JsonlResultsWriter(path)
+
+
+class JsonlResultsWriter(object):
+  """Appends each record to path as one line of JSON"""
+
+  def __init__(self, path):
+    self.path = path
+    self.file = open(path, 'a')
+
+  def write(self, record):
+    self.file.write(json.dumps(record) + "\n")
+    self.file.flush()
+
+  def close(self):
+    self.file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+
+class CsvResultsWriter(JsonlResultsWriter):
+  """Appends each record to path as one CSV row, with a header when the file is new.
+  Flat dicts and lists are spread over columns (player_stats_0_score), anything deeper is JSON encoded.
+  The columns are those of the existing header, or of the first record in a new file. A record missing
+  some leaves them empty, and one with columns the header lacks is refused"""
+
+  def __init__(self, path):
+    super().__init__(path)
+    self.fieldnames = self._read_header(path)
+    self.writer = None if self.fieldnames is None else csv.DictWriter(self.file, fieldnames=self.fieldnames, restval='')
+
+  @staticmethod
+  def _read_header(path):
+    with open(path, newline='') as existing:
+      return next(csv.reader(existing), None)
+
+  def write(self, record):
+    row = flatten_record(record)
+    if self.writer is None:
+      self.fieldnames = list(row.keys())
+      self.writer = csv.DictWriter(self.file, fieldnames=self.fieldnames, restval='')
+      self.writer.writeheader()
+    extra = [key for key in row if key not in self.fieldnames]
+    if extra:
+      raise ValueError(f"Record has columns missing from the header of {self.path}: {', '.join(extra)}."
+                       " Write it to a new results file")
+    self.writer.writerow(row)
+    self.file.flush()
+
+
+def flatten_record(record):
+  row = {}
+  for key, value in record.items():
+    _flatten(row, key, value)
+  return row
+
+
+def _flatten(row, key, value):
+  if isinstance(value, dict) and all(_is_scalar(v) for v in value.values()):
+    for k, v in value.items():
+      row[f"{key}_{k}"] = v
+  elif isinstance(value, list) and all(_is_scalar(v) or isinstance(v, dict) for v in value):
+    for i, v in enumerate(value):
+      _flatten(row, f"{key}_{i}", v)
+  elif _is_scalar(value):
+    row[key] = value
+  else:
+    row[key] = json.dumps(value)
+
+
+def _is_scalar(value):
+  return value is None or isinstance(value, (str, int, float, bool))
+
+
+def read_results(path):
+  """Records of a JSON lines results file, skipping a line cut short by a stopped run"""
+  records = []
+  with open(path) as results:
+    for line in results:
+      try:
+        records.append(json.loads(line))
+      except json.JSONDecodeError:
+        pass
+  return records
+
+
+class ExperimentCheckpoint(object):
+  """Append-only log of finished episodes, for resuming a stopped run.
+  The first line holds the flags that fix what each episode plays, each further line one episode's result.
+  Episodes are seeded from flags['seed'] + episode alone, so the number of finished episodes is the
+  whole random state a resumed run needs."""
+
+  FLAG_KEYS = ('players', 'agent_classes', 'mcts_types', 'seed')
+
+  def __init__(self, path, every=1, results_writer=None):
+    """every: episodes buffered between writes
+    results_writer: gets each episode's record only when the episode is checkpointed, so a resumed run
+    does not write the records of the episodes it replays a second time"""
+    self.path = path
+    self.every = max(every, 1)
+    self.results_writer = results_writer
+    self.pending = []
+    self.pending_records = []
+    self.file = None
+
+  @staticmethod
+  def read(path):
+    """(flags, results) of a checkpoint, results being the finished episodes in order. (None, []) if absent"""
+    if not os.path.exists(path):
+      return None, []
+    flags = None
+    results = []
+    with open(path) as checkpoint:
+      for line in checkpoint:
+        try:
+          entry = json.loads(line)
+        except json.JSONDecodeError:
+          break  # Cut short by a stopped run
+        if flags is None:
+          flags = entry['flags']
+        elif entry['episode'] == len(results):
+          results.append(entry['result'])
+    return flags, results
+
+  def start(self, flags, resume):
+    """Open for writing, returning the finished episodes' results when resuming.
+    Raises ValueError when the checkpoint was made with different flags."""
+    checkpoint_flags, results = self.read(self.path) if resume else (None, [])
+    flags = {key: flags[key] for key in self.FLAG_KEYS}
+    if checkpoint_flags is not None and checkpoint_flags != flags:
+      raise ValueError(f"Checkpoint {self.path} was made with {checkpoint_flags}, not {flags}")
+    # Rewrite without any line cut short by a stopped run, replacing the old file only once complete
+    with open(self.path + '.tmp', 'w') as rewrite:
+      rewrite.write(json.dumps({'flags': flags}) + "\n")
+      for episode, result in enumerate(results):
+        rewrite.write(json.dumps({'episode': episode, 'result': result}) + "\n")
+    os.replace(self.path + '.tmp', self.path)
+    self.file = open(self.path, 'a')
+    return results
+
+  def add(self, episode, result, record=None):
+    """record: the episode's results file record, held back with it"""
+    self.pending.append({'episode': episode, 'result': result})
+    if record is not None:
+      self.pending_records.append(record)
+    if len(self.pending) >= self.every:
+      self.flush()
+
+  def flush(self):
+    for record in self.pending_records:
+      self.results_writer.write(record)
+    self.pending_records = []
+    for entry in self.pending:
+      self.file.write(json.dumps(entry) + "\n")
+    self.pending = []
+    self.file.flush()
+
+  def close(self):
+    self.flush()
+    self.file.close()
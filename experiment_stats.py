@@ -0,0 +1,67 @@
+# Confidence intervals for experiment scores, including paired comparisons of agent configurations
+# that played the same seeded deals
+import functools
+import math
+from statistics import NormalDist
+
+
+@functools.lru_cache(maxsize=None)
+def t_quantile(p, df):
+  """Student t quantile. Up to 30 degrees of freedom the t distribution function is inverted numerically,
+  where the Cornish-Fisher expansion about the normal falls short (9.7 against 12.71 for a 95% interval
+  at 1). Beyond that the expansion is within 0.01%"""
+  if p < 0.5:
+    return -t_quantile(1 - p, df)
+  z = NormalDist().inv_cdf(p)
+  if df == math.inf:
+    return z
+  t = (z + (z ** 3 + z) / (4 * df) + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2)
+       + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * df ** 3))
+  if df > 30:
+    return t
+  # Newton's method from the expansion, on the distribution function integrated by Simpson's rule
+  for _ in range(50):
+    step = (_t_cdf(t, df) - p) / _t_pdf(t, df)
+    t -= step
+    if abs(step) < 1e-10 * t:
+      break
+  return t
+
+
+def _t_pdf(x, df):
+  return math.exp(math.lgamma((df + 1) / 2) - math.lgamma(df / 2) - (df + 1) / 2 * math.log1p(x * x / df)) / math.sqrt(df * math.pi)
+
+
+def _t_cdf(t, df, intervals=2000):
+  """Distribution function at t >= 0"""
+  h = t / intervals
+  total = _t_pdf(0, df) + _t_pdf(t, df)
+  total += sum((4 if i % 2 else 2) * _t_pdf(i * h, df) for i in range(1, intervals))
+  return 0.5 + total * h / 3
+
+
+def mean_interval(values, confidence=0.95):
+  """(mean, half width of the t confidence interval). Half width is inf for fewer than two values"""
+  n = len(values)
+  mean = sum(values) / n
+  if n < 2:
+    return mean, math.inf
+  variance = sum((v - mean) ** 2 for v in values) / (n - 1)
+  return mean, t_quantile(0.5 + confidence / 2, n - 1) * math.sqrt(variance / n)
+
+
+def paired_comparison(scores, reference_scores, confidence=0.95):
+  """Mean score difference against a reference that played the same deals, episode by episode.
+  unpaired_half_width is what independent deals would have given, and games_ratio how many times more
+  independent games the same interval would need"""
+  if len(scores) != len(reference_scores):
+    raise ValueError(f"Paired scores need the same episodes, got {len(scores)} and {len(reference_scores)}")
+  n = len(scores)
+  difference, half_width = mean_interval([s - r for s, r in zip(scores, reference_scores)], confidence)
+  mean, score_half_width = mean_interval(scores, confidence)
+  reference_mean, reference_half_width = mean_interval(reference_scores, confidence)
+  unpaired_half_width = math.sqrt(score_half_width ** 2 + reference_half_width ** 2)
+  return {'episodes': n, 'mean': mean, 'reference_mean': reference_mean, 'difference': difference
+          , 'ci': (difference - half_width, difference + half_width), 'half_width': half_width
+          , 'unpaired_half_width': unpaired_half_width
+          , 'games_ratio': (unpaired_half_width / half_width) ** 2 if 0 < half_width < math.inf else None}
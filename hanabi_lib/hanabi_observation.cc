@@ -64,6 +64,8 @@ HanabiObservation::HanabiObservation(const HanabiState& state,
                                         state.ParentGame()->NumPlayers())),
       discard_pile_(state.DiscardPile()),
       fireworks_(state.Fireworks()),
+      discard_counts_(state.DiscardCounts()),
+      max_fireworks_(state.MaxFireworks()),
       deck_size_(state.Deck().Size()),
       information_tokens_(state.InformationTokens()),
       life_tokens_(state.LifeTokens()),
@@ -43,6 +43,9 @@ class HanabiObservation {
   // The element at the back is the most recent discard.
   const std::vector<HanabiCard>& DiscardPile() const { return discard_pile_; }
   const std::vector<int>& Fireworks() const { return fireworks_; }
+  // MB: Copied from the state, see HanabiState::DiscardCounts/MaxFireworks.
+  const std::vector<int>& DiscardCounts() const { return discard_counts_; }
+  const std::vector<int>& MaxFireworks() const { return max_fireworks_; }
   int DeckSize() const { return deck_size_; }  // number of remaining cards
   const HanabiGame* ParentGame() const { return parent_game_; }
   // Moves made since observing_player's last action, most recent to oldest
@@ -67,6 +70,8 @@ class HanabiObservation {
   std::vector<HanabiHand> hands_;         // observing player is element 0
   std::vector<HanabiCard> discard_pile_;  // back is most recent discard
   std::vector<int> fireworks_;
+  std::vector<int> discard_counts_;
+  std::vector<int> max_fireworks_;
   int deck_size_;
   std::vector<HanabiHistoryItem> last_moves_;
   int information_tokens_;
@@ -48,6 +48,12 @@ uint8_t HandRankBitmask(const HanabiHand& hand, int rank) {
   }
   return mask;
 }
+
+// MB: Determinization moves only manipulate hands for RIS-MCTS forward models.
+bool IsDeterminizationMove(const HanabiMove& move) {
+  return move.MoveType() == HanabiMove::kReturn ||
+         move.MoveType() == HanabiMove::kDealSpecific;
+}
 }  // namespace
 
 HanabiState::HanabiDeck::HanabiDeck(const HanabiGame& game)
@@ -111,6 +117,20 @@ void HanabiState::HanabiDeck::ReturnCard(int color, int rank) {
   //std::cout<<card_count_[index];
 }
 
+bool HanabiState::SetParentGame(const HanabiGame* game) {
+  if (game->NumPlayers() != parent_game_->NumPlayers() ||
+      game->NumColors() != parent_game_->NumColors() ||
+      game->NumRanks() != parent_game_->NumRanks() ||
+      game->HandSize() != parent_game_->HandSize() ||
+      game->MaxInformationTokens() != parent_game_->MaxInformationTokens() ||
+      game->MaxLifeTokens() != parent_game_->MaxLifeTokens() ||
+      game->ObservationType() != parent_game_->ObservationType()) {
+    return false;
+  }
+  parent_game_ = game;
+  return true;
+}
+
 HanabiState::HanabiState(const HanabiGame* parent_game, int start_player)
     : parent_game_(parent_game),
       deck_(*parent_game),
@@ -123,8 +143,19 @@ HanabiState::HanabiState(const HanabiGame* parent_game, int start_player)
       information_tokens_(parent_game->MaxInformationTokens()),
       life_tokens_(parent_game->MaxLifeTokens()),
       fireworks_(parent_game->NumColors(), 0),
+      discard_counts_(parent_game->NumColors() * parent_game->NumRanks(), 0),
+      max_fireworks_(parent_game->NumColors(), parent_game->NumRanks()),
       turns_to_play_(parent_game->NumPlayers()) {}
 
+void HanabiState::RecordDiscard(HanabiCard card) {
+  const int num_discarded =
+      ++discard_counts_[card.Color() * ParentGame()->NumRanks() + card.Rank()];
+  if (num_discarded == ParentGame()->NumberCardInstances(card) &&
+      card.Rank() < max_fireworks_[card.Color()]) {
+    max_fireworks_[card.Color()] = card.Rank();
+  }
+}
+
 void HanabiState::RemoveKnowledge(int player, int card_index) {
     // MB: Define the default card knowledge structure
     HanabiHand::CardKnowledge card_knowledge(ParentGame()->NumColors(),
@@ -171,6 +202,26 @@ void HanabiState::DecrementLifeTokens() {
   --life_tokens_;
 }
 
+void HanabiState::AddToHistory(const HanabiHistoryItem& history) {
+  if (IsDeterminizationMove(history.move)) {
+    if (history_mode_ == kSkipDeterminization) {
+      return;
+    }
+    // MB: Overwrite the previous determinization item of the same player, so
+    // a redeterminization leaves one marker (its final move) per run of a
+    // player's items. HanabiObservation::last_moves stops at the observer's
+    // latest item, which is the one kept, so it stops where it would with
+    // the full history and only loses repeated markers.
+    if (history_mode_ == kCompactDeterminization && !move_history_.empty() &&
+        IsDeterminizationMove(move_history_.back().move) &&
+        move_history_.back().player == history.player) {
+      move_history_.back() = history;
+      return;
+    }
+  }
+  move_history_.push_back(history);
+}
+
 std::pair<bool, bool> HanabiState::AddToFireworks(HanabiCard card) {
   if (CardPlayableOnFireworks(card)) {
     ++fireworks_[card.Color()];
@@ -285,7 +336,7 @@ void HanabiState::ApplyMove(HanabiMove move) {
   if (deck_.Empty() && move.MoveType() != HanabiMove::kDealSpecific && move.MoveType()!= HanabiMove::kReturn) {
     --turns_to_play_;
   }
-  // MB: Do we really want a RETURN or DEALSPECFIC move to add to history? Might have to deal with this in history
+  // MB: RETURN and DEALSPECIFIC moves are recorded according to history_mode_
   HanabiHistoryItem history(move);
   history.player = cur_player_;
   switch (move.MoveType()) {
@@ -315,6 +366,7 @@ void HanabiState::ApplyMove(HanabiMove move) {
       history.color = hands_[cur_player_].Cards()[move.CardIndex()].Color();
       history.rank = hands_[cur_player_].Cards()[move.CardIndex()].Rank();
       hands_[cur_player_].RemoveFromHand(move.CardIndex(), &discard_pile_);
+      RecordDiscard(discard_pile_.back());
       break;
     case HanabiMove::kReturn:
       //MB: Return bastardises framework and uses TargetOffset to specify which hand to remove from
@@ -332,6 +384,9 @@ void HanabiState::ApplyMove(HanabiMove move) {
           AddToFireworks(hands_[cur_player_].Cards()[move.CardIndex()]);
       hands_[cur_player_].RemoveFromHand(
           move.CardIndex(), history.scored ? nullptr : &discard_pile_);
+      if (!history.scored) {
+        RecordDiscard(discard_pile_.back());
+      }
       break;
     case HanabiMove::kRevealColor:
       DecrementInformationTokens();
@@ -350,7 +405,7 @@ void HanabiState::ApplyMove(HanabiMove move) {
     default:
       std::abort();  // Should not be possible.
   }
-  move_history_.push_back(history);
+  AddToHistory(history);
   //MB WARNING: DealSpecific skips this step.
   AdvanceToNextPlayer(move.MoveType() == HanabiMove::kDealSpecific);
 }
@@ -66,6 +66,16 @@ class HanabiState {
     kCompletedFireworks  // All fireworks played.
   };
 
+  // MB: How RETURN and DEAL_SPECIFIC (determinization) moves are recorded.
+  // Redeterminizing applies many of these per simulated turn, which would
+  // otherwise grow move_history_ and the cost of every copy.
+  enum HistoryMode {
+    kFullHistory,           // Record every move (default).
+    kSkipDeterminization,   // Determinization moves are not recorded.
+    kCompactDeterminization // Consecutive determinization moves of the same
+                            // player share one item.
+  };
+
   // Construct a HanabiState, initialised to the start of the game.
   // If start_player >= 0, the game-provided start player is overridden
   // and the first player after chance is start_player.
@@ -100,13 +110,24 @@ class HanabiState {
   int LifeTokens() const { return life_tokens_; }
   int InformationTokens() const { return information_tokens_; }
   int TurnsToPlay() const {return turns_to_play_; }
+  HistoryMode GetHistoryMode() const { return history_mode_; }
+  void SetHistoryMode(HistoryMode mode) { history_mode_ = mode; }
 
   const std::vector<HanabiHand>& Hands() const { return hands_; }
   const std::vector<int>& Fireworks() const { return fireworks_; }
   const HanabiGame* ParentGame() const { return parent_game_; }
+  // MB: Point the state at another game with the same rules, so that its
+  // random deals draw from that game's rng. Returns false if the rules differ.
+  bool SetParentGame(const HanabiGame* game);
   const HanabiDeck& Deck() const { return deck_; }
   // Get the discard pile (the element at the back is the most recent discard.)
   const std::vector<HanabiCard>& DiscardPile() const { return discard_pile_; }
+  // MB: Discarded copies of each card, indexed color * NumRanks() + rank.
+  // Maintained on each discard and failed play.
+  const std::vector<int>& DiscardCounts() const { return discard_counts_; }
+  // MB: Highest firework reachable per color: the lowest rank with every copy
+  // discarded, or NumRanks().
+  const std::vector<int>& MaxFireworks() const { return max_fireworks_; }
   // Sequence of moves from beginning of game. Stored as <move, actor>.
   const std::vector<HanabiHistoryItem>& MoveHistory() const {
     return move_history_;
@@ -131,6 +152,9 @@ class HanabiState {
   bool IncrementInformationTokens();
   void DecrementInformationTokens();
   void DecrementLifeTokens();
+  void AddToHistory(const HanabiHistoryItem& history);
+  // Update discard counts and max fireworks for card added to discard_pile_.
+  void RecordDiscard(HanabiCard card);
 
   const HanabiGame* parent_game_ = nullptr;
   HanabiDeck deck_;
@@ -143,7 +167,10 @@ class HanabiState {
   int information_tokens_ = -1;
   int life_tokens_ = -1;
   std::vector<int> fireworks_;
+  std::vector<int> discard_counts_;
+  std::vector<int> max_fireworks_;
   int turns_to_play_ = -1;  // Number of turns to play once deck is empty.
+  HistoryMode history_mode_ = kFullHistory;
 };
 
 }  // namespace hanabi_learning_env
@@ -13,6 +13,7 @@
 // limitations under the License.
 
 #include "pyhanabi.h"
+#include <algorithm>
 
 #include <cstdlib>
 #include <cstring>
@@ -334,6 +335,16 @@ const void* StateParentGame(pyhanabi_state_t* state) {
           ->ParentGame());
 }
 
+bool StateSetParentGame(pyhanabi_state_t* state, pyhanabi_game_t* game) {
+  REQUIRE(state != nullptr);
+  REQUIRE(state->state != nullptr);
+  REQUIRE(game != nullptr);
+  REQUIRE(game->game != nullptr);
+  return reinterpret_cast<hanabi_learning_env::HanabiState*>(state->state)
+      ->SetParentGame(
+          reinterpret_cast<hanabi_learning_env::HanabiGame*>(game->game));
+}
+
 void StateApplyMove(pyhanabi_state_t* state, pyhanabi_move_t* move) {
   REQUIRE(state != nullptr);
   REQUIRE(state->state != nullptr);
@@ -503,6 +514,21 @@ bool CardPlayableOnFireworks(const pyhanabi_state_t* state, int color,
       ->CardPlayableOnFireworks(color, rank);
 }
 
+int StateHistoryMode(pyhanabi_state_t* state) {
+  REQUIRE(state != nullptr);
+  REQUIRE(state->state != nullptr);
+  return reinterpret_cast<const hanabi_learning_env::HanabiState*>(state->state)
+      ->GetHistoryMode();
+}
+
+void StateSetHistoryMode(pyhanabi_state_t* state, int mode) {
+  REQUIRE(state != nullptr);
+  REQUIRE(state->state != nullptr);
+  reinterpret_cast<hanabi_learning_env::HanabiState*>(state->state)
+      ->SetHistoryMode(
+          static_cast<hanabi_learning_env::HanabiState::HistoryMode>(mode));
+}
+
 int StateLenMoveHistory(pyhanabi_state_t* state) {
   REQUIRE(state != nullptr);
   REQUIRE(state->state != nullptr);
@@ -522,6 +548,47 @@ void StateGetMoveHistory(pyhanabi_state_t* state, int index,
           .at(index));
 }
 
+void StateLegalMovesMask(pyhanabi_state_t* state, int* mask) {
+  REQUIRE(state != nullptr);
+  REQUIRE(state->state != nullptr);
+  REQUIRE(mask != nullptr);
+  auto hanabi_state =
+      reinterpret_cast<const hanabi_learning_env::HanabiState*>(state->state);
+  const hanabi_learning_env::HanabiGame* game = hanabi_state->ParentGame();
+  const int max_moves = game->MaxMoves();
+  std::fill(mask, mask + max_moves, 0);
+  // MB: Consistent with HanabiState.legal_moves, no moves from terminal state
+  if (hanabi_state->IsTerminal() ||
+      hanabi_state->CurPlayer() == hanabi_learning_env::kChancePlayerId) {
+    return;
+  }
+  for (int uid = 0; uid < max_moves; ++uid) {
+    mask[uid] = hanabi_state->MoveIsLegal(game->GetMove(uid));
+  }
+}
+
+void StateHandKnowledgeMask(pyhanabi_state_t* state, int pid, int* mask) {
+  REQUIRE(state != nullptr);
+  REQUIRE(state->state != nullptr);
+  REQUIRE(mask != nullptr);
+  auto hanabi_state =
+      reinterpret_cast<const hanabi_learning_env::HanabiState*>(state->state);
+  const hanabi_learning_env::HanabiGame* game = hanabi_state->ParentGame();
+  const int num_colors = game->NumColors();
+  const int num_ranks = game->NumRanks();
+  std::fill(mask, mask + game->HandSize() * num_colors * num_ranks, 0);
+  const auto& knowledge = hanabi_state->Hands()[pid].Knowledge();
+  for (int index = 0; index < knowledge.size(); ++index) {
+    for (int color = 0; color < num_colors; ++color) {
+      for (int rank = 0; rank < num_ranks; ++rank) {
+        mask[(index * num_colors + color) * num_ranks + rank] =
+            knowledge[index].ColorPlausible(color) &&
+            knowledge[index].RankPlausible(rank);
+      }
+    }
+  }
+}
+
 /* Wrapper definitions for HanabiGame. */
 void DeleteGame(pyhanabi_game_t* game) {
   REQUIRE(game != nullptr);
@@ -745,6 +812,31 @@ int ObsFireworks(pyhanabi_observation_t* observation, int color) {
       .at(color);
 }
 
+int ObsDiscardCounts(pyhanabi_observation_t* observation, int* counts) {
+  REQUIRE(observation != nullptr);
+  REQUIRE(observation->observation != nullptr);
+  REQUIRE(counts != nullptr);
+  auto hanabi_observation =
+      reinterpret_cast<hanabi_learning_env::HanabiObservation*>(
+          observation->observation);
+  const auto& discard_counts = hanabi_observation->DiscardCounts();
+  std::copy(discard_counts.begin(), discard_counts.end(), counts);
+  return hanabi_observation->ParentGame()->NumRanks();
+}
+
+int ObsMaxFireworks(pyhanabi_observation_t* observation, int* max_fireworks) {
+  REQUIRE(observation != nullptr);
+  REQUIRE(observation->observation != nullptr);
+  REQUIRE(max_fireworks != nullptr);
+  const auto& max_fireworks_vector =
+      reinterpret_cast<hanabi_learning_env::HanabiObservation*>(
+          observation->observation)
+          ->MaxFireworks();
+  std::copy(max_fireworks_vector.begin(), max_fireworks_vector.end(),
+            max_fireworks);
+  return max_fireworks_vector.size();
+}
+
 int ObsDeckSize(pyhanabi_observation_t* observation) {
   REQUIRE(observation != nullptr);
   REQUIRE(observation->observation != nullptr);
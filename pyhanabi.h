@@ -114,6 +114,7 @@ void NewState(pyhanabi_game_t* game, pyhanabi_state_t* state);
 void CopyState(const pyhanabi_state_t* src, pyhanabi_state_t* dest);
 void DeleteState(pyhanabi_state_t* state);
 const void* StateParentGame(pyhanabi_state_t* state);
+bool StateSetParentGame(pyhanabi_state_t* state, pyhanabi_game_t* game);
 void StateApplyMove(pyhanabi_state_t* state, pyhanabi_move_t* move);
 void StateRemoveKnowledge(pyhanabi_state_t* state, int pid, int index);
 int StateCurPlayer(pyhanabi_state_t* state);
@@ -136,9 +137,16 @@ char* StateToString(pyhanabi_state_t* state);
 bool MoveIsLegal(const pyhanabi_state_t* state, const pyhanabi_move_t* move);
 bool CardPlayableOnFireworks(const pyhanabi_state_t* state, int color,
                              int rank);
+int StateHistoryMode(pyhanabi_state_t* state);
+void StateSetHistoryMode(pyhanabi_state_t* state, int mode);
 int StateLenMoveHistory(pyhanabi_state_t* state);
 void StateGetMoveHistory(pyhanabi_state_t* state, int index,
                          pyhanabi_history_item_t* item);
+/* Fill mask[uid] with 1 for each legal move uid (MaxMoves entries). */
+void StateLegalMovesMask(pyhanabi_state_t* state, int* mask);
+/* Fill mask[(index * colors + color) * ranks + rank] with 1 where the card
+   at index in pid's hand could be (color, rank). HandSize entries per rank. */
+void StateHandKnowledgeMask(pyhanabi_state_t* state, int pid, int* mask);
 
 /* Game functions. */
 void DeleteGame(pyhanabi_game_t* game);
@@ -173,6 +181,11 @@ int ObsDiscardPileSize(pyhanabi_observation_t* observation);
 void ObsGetDiscard(pyhanabi_observation_t* observation, int index,
                    pyhanabi_card_t* card);
 int ObsFireworks(pyhanabi_observation_t* observation, int color);
+/* Fill counts[color * ranks + rank] with the discarded copies of each card.
+   Returns the number of ranks. */
+int ObsDiscardCounts(pyhanabi_observation_t* observation, int* counts);
+/* Fill max_fireworks[color]. Returns the number of colors. */
+int ObsMaxFireworks(pyhanabi_observation_t* observation, int* max_fireworks);
 int ObsDeckSize(pyhanabi_observation_t* observation);
 int ObsNumLastMoves(pyhanabi_observation_t* observation);
 void ObsGetLastMove(pyhanabi_observation_t* observation, int index,
@@ -13,12 +13,15 @@
 # limitations under the License.
 
 """Python interface to Hanabi code."""
+import glob
 import os
 import re
 import cffi
 import enum
 import sys
 import random
+import hashlib
+import warnings
 
 DEFAULT_CDEF_PREFIXES = (None, ".", os.path.dirname(__file__), "/include")
 DEFAULT_LIB_PREFIXES = (None, ".", os.path.dirname(__file__), "/lib")
@@ -27,10 +30,100 @@ PYHANABI_LIB = ["libpyhanabi.so", "libpyhanabi.dylib"]
 COLOR_CHAR = ["R", "Y", "G", "W", "B"]  # consistent with hanabi_lib/util.cc
 CHANCE_PLAYER_ID = -1
 
-ffi = cffi.FFI()
-lib = None
-cdef_loaded_flag = False
-lib_loaded_flag = False
+
+def read_cdef(header_file):
+  """Return the declarations inside the extern "C" block of a pyhanabi header.
+
+  Shared by try_cdef and pyhanabi_build.py, so ABI and API mode parse the
+  header the same way. Raises IOError if header_file cannot be read.
+  """
+  reading_cdef = False
+  cdef_string = ""
+  with open(header_file) as header:
+    lines = header.readlines()
+  for line in lines:
+    line = line.rstrip()
+    if re.match("extern *\"C\" *{", line):
+      reading_cdef = True
+      continue
+    elif re.match("} */[*] *extern *\"C\" *[*]/", line):
+      reading_cdef = False
+      continue
+    if reading_cdef:
+      cdef_string = cdef_string + line + "\n"
+  return cdef_string
+
+
+def source_files(header_file):
+  """Return the C++ sources built with the header, or [] if they are not beside it."""
+  root = os.path.dirname(header_file)
+  if not os.path.isfile(os.path.join(root, "pyhanabi.cc")):
+    return []
+  library = os.path.join(root, "hanabi_lib")
+  return [os.path.join(root, "pyhanabi.cc")] + sorted(
+      glob.glob(os.path.join(library, "*.cc")) +
+      glob.glob(os.path.join(library, "*.h")))
+
+
+def source_hash(header_file):
+  """Hash of the cdef and C++ sources, compiled into _pyhanabi to tell when it
+  is out of date. None if the sources are not beside the header."""
+  sources = source_files(header_file)
+  if not sources:
+    return None
+  digest = hashlib.sha1(read_cdef(header_file).encode())
+  for source in sources:
+    with open(source, "rb") as source_file:
+      digest.update(os.path.basename(source).encode())
+      digest.update(source_file.read())
+  return digest.hexdigest()
+
+
+def find_header(header=PYHANABI_HEADER, prefixes=DEFAULT_CDEF_PREFIXES):
+  """Return the path of the first readable pyhanabi header, or None."""
+  for prefix in prefixes:
+    header_file = header if prefix is None else prefix + "/" + header
+    if os.path.isfile(header_file):
+      return header_file
+  return None
+
+
+def _api_extension_stale(api_ffi, api_lib):
+  """True if _pyhanabi was compiled from a different header or C++ sources
+  than the ones found.
+
+  MB: A libpyhanabi rebuilt after changing pyhanabi.h, pyhanabi.cc or
+  hanabi_lib would otherwise be shadowed by an old extension without notice.
+  """
+  header_file = find_header()
+  current_hash = source_hash(header_file) if header_file is not None else None
+  if current_hash is None:
+    return False
+  built_hash = getattr(api_lib, "PYHANABI_SOURCE_SHA1", None)
+  return built_hash is None or (
+      api_ffi.string(built_hash).decode() != current_hash)
+
+
+try:
+  # MB: Prefer the compiled API-mode extension (see pyhanabi_build.py) which
+  # skips header parsing and libffi dispatch. Set PYHANABI_ABI=1 to disable.
+  if os.environ.get("PYHANABI_ABI"):
+    raise ImportError("API-mode pyhanabi disabled by PYHANABI_ABI")
+  from _pyhanabi import ffi, lib
+  if _api_extension_stale(ffi, lib):
+    warnings.warn("_pyhanabi was built from different pyhanabi sources, "
+                  "falling back to ABI mode. Rerun pyhanabi_build.py to "
+                  "update it.")
+    raise ImportError("API-mode pyhanabi is out of date")
+  cdef_loaded_flag = True
+  lib_loaded_flag = True
+  api_mode_flag = True
+except ImportError:
+  ffi = cffi.FFI()
+  lib = None
+  cdef_loaded_flag = False
+  lib_loaded_flag = False
+  api_mode_flag = False
 
 
 if sys.version_info < (3,):
@@ -54,20 +147,7 @@ def try_cdef(header=PYHANABI_HEADER, prefixes=DEFAULT_CDEF_PREFIXES):
   for prefix in prefixes:
     try:
       cdef_file = header if prefix is None else prefix + "/" + header
-      lines = open(cdef_file).readlines()
-      reading_cdef = False
-      cdef_string = ""
-      for line in lines:
-        line = line.rstrip()
-        if re.match("extern *\"C\" *{", line):
-          reading_cdef = True
-          continue
-        elif re.match("} */[*] *extern *\"C\" *[*]/", line):
-          reading_cdef = False
-          continue
-        if reading_cdef:
-          cdef_string = cdef_string + line + "\n"
-      ffi.cdef(cdef_string)
+      ffi.cdef(read_cdef(cdef_file))
       cdef_loaded_flag = True
       return True
     except IOError:
@@ -115,6 +195,11 @@ def lib_loaded():
   return lib_loaded_flag
 
 
+def api_mode():
+  """Return True if the compiled API-mode extension is in use."""
+  return api_mode_flag
+
+
 def color_idx_to_char(color_idx):
   """Helper function for converting color index to a character.
 
@@ -538,6 +623,37 @@ class HanabiEndOfGameType(enum.IntEnum):
   COMPLETED_FIREWORKS = 3
 
 
+class HanabiHistoryMode(enum.IntEnum):
+  """How determinization moves are recorded, consistent with hanabi_state.h.
+
+  FULL records every move. SKIP_DETERMINIZATION leaves RETURN and
+  DEAL_SPECIFIC moves out of the move history. COMPACT_DETERMINIZATION keeps a
+  single item (the latest such move) per run of consecutive determinization
+  moves of the same player, marking that the hands were redeterminized.
+  Observations' last_moves then stop at the same move as with FULL.
+  """
+  FULL = 0
+  SKIP_DETERMINIZATION = 1
+  COMPACT_DETERMINIZATION = 2
+
+
+def _int_buffer(out, size, name):
+  """MB: out as a C int array, after checking the C helper can write size ints.
+
+  ffi.from_buffer takes any buffer, so a float, int64, strided or short array
+  would otherwise be written out of bounds or filled with garbage.
+  """
+  view = memoryview(out)
+  if (view.readonly or not view.c_contiguous or
+      view.format not in ("i", "=i", "<i") or view.itemsize != ffi.sizeof("int")):
+    raise ValueError("{} needs a writable C-contiguous int32 buffer, got format "
+                     "{!r}".format(name, view.format))
+  if view.nbytes < size * view.itemsize:
+    raise ValueError("{} needs {} entries, got {}".format(
+        name, size, view.nbytes // view.itemsize))
+  return ffi.from_buffer("int[]", out)
+
+
 class HanabiState(object):
   """Current environment state for an active Hanabi game.
 
@@ -548,12 +664,13 @@ class HanabiState(object):
   Python wrapper of C++ HanabiState class.
   """
 
-  def __init__(self, game, c_state=None):
+  def __init__(self, game, c_state=None, c_game=None):
     """Returns a new state.
 
     Args:
       game: HanabiGame describing the parameters for a game of Hanabi.
       c_state: C++ state to copy, or None for a new state.
+      c_game: MB: pyhanabi_game_t of c_state's parent game, if already known.
 
     NOTE: If c_state is supplied, game is ignored and c_state game is used.
     """
@@ -561,8 +678,14 @@ class HanabiState(object):
     if c_state is None:
       self._game = game.c_game
       lib.NewState(self._game, self._state)
+    elif c_game is not None:
+      self._game = c_game
+      lib.CopyState(c_state, self._state)
     else:
-      self._game = lib.StateParentGame(c_state)
+      # MB: Wrap the parent game so game accessors like lib.NumColors work on
+      # copies. The wrapper does not own the game, which stays with HanabiGame
+      self._game = ffi.new("pyhanabi_game_t*")
+      self._game.game = ffi.cast("void*", lib.StateParentGame(c_state))
       lib.CopyState(c_state, self._state)
 
     # MB: WARNING: Need a way of better Deck copying
@@ -570,7 +693,9 @@ class HanabiState(object):
 
   def copy(self):
     """Returns a copy of the state."""
-    return HanabiState(None, self._state)
+    # MB: Shares this state's game wrapper rather than wrapping the parent game
+    # again, which cost about a fifth of a copy
+    return HanabiState(None, self._state, self._game)
 
   def observation(self, player):
     """Returns player's observed view of current environment state."""
@@ -611,9 +736,7 @@ class HanabiState(object):
     played, this function returns [1, 0, 0, 0, 0].
     """
     firework_list = []
-    # MB Hack: This line originally: lib.NumColors(self._game), but broke copying HanabiState.
-    # MB: Replaced by hard-coded
-    num_colors = 5
+    num_colors = lib.NumColors(self._game)
     # print(f"pyhanabi.HanabiState.fireworks: lib.NumColors is {num_colors}")
     for c in range(num_colors):
       firework_list.append(lib.StateFireworks(self._state, c))
@@ -634,6 +757,15 @@ class HanabiState(object):
     else:
       return self.progress()
 
+  def set_game(self, game):
+    """MB: Re-parent the state onto game, a HanabiGame with the same rules.
+
+    Random deals then draw from game's rng rather than the original game's.
+    """
+    if not lib.StateSetParentGame(self._state, game.c_game):
+      raise ValueError("set_game needs a game with the same rules as the state's")
+    self._game = game.c_game
+
   def deal_random_card(self):
     """If cur_player == CHANCE_PLAYER_ID, make a random card-deal move."""
     lib.StateDealCard(self._state)
@@ -693,6 +825,29 @@ class HanabiState(object):
     lib.DeleteMoveList(c_movelist)
     return moves
 
+  def legal_moves_mask(self, out):
+    """MB: Fill out with 1 at the uid of each legal move, 0 elsewhere.
+
+    Args:
+      out: writable contiguous int32 buffer of max_moves() entries (e.g. a
+        numpy array row). Empty if the state is terminal.
+    """
+    size = lib.MaxMoves(self._game)
+    lib.StateLegalMovesMask(self._state, _int_buffer(out, size, "legal_moves_mask"))
+
+  def hand_knowledge_mask(self, player, out):
+    """MB: Fill out with 1 where a card in player's hand could be (color, rank).
+
+    Args:
+      player: absolute player index.
+      out: writable contiguous int32 buffer of hand_size * colors * ranks
+        entries, indexed [card_index][color][rank]. Missing cards are all 0.
+    """
+    size = (lib.HandSize(self._game) * lib.NumColors(self._game) *
+            lib.NumRanks(self._game))
+    lib.StateHandKnowledgeMask(self._state, player,
+                               _int_buffer(out, size, "hand_knowledge_mask"))
+
   def move_is_legal(self, move):
     """Returns true if and only if move is legal for active agent."""
     return lib.MoveIsLegal(self._state, move.c_move)
@@ -721,6 +876,14 @@ class HanabiState(object):
     """
     return lib.StateScore(self._state)
 
+  def history_mode(self):
+    """Returns how determinization moves are recorded in the move history."""
+    return HanabiHistoryMode(lib.StateHistoryMode(self._state))
+
+  def set_history_mode(self, mode):
+    """MB: Set how RETURN/DEAL_SPECIFIC moves are recorded. Kept by copies."""
+    lib.StateSetHistoryMode(self._state, mode)
+
   def move_history(self):
     """Returns list of moves made, from oldest to most recent."""
     history = []
@@ -971,6 +1134,24 @@ class HanabiObservation(object):
       firework_list.append(lib.ObsFireworks(self._observation, c))
     return firework_list
 
+  def discard_counts(self):
+    """MB: Returns discarded copies of each card, as a list by color of lists by rank."""
+    num_colors = lib.NumColors(self._game)
+    num_ranks = lib.NumRanks(self._game)
+    counts = ffi.new("int[]", num_colors * num_ranks)
+    lib.ObsDiscardCounts(self._observation, counts)
+    counts = ffi.unpack(counts, num_colors * num_ranks)
+    return [counts[c * num_ranks:(c + 1) * num_ranks] for c in range(num_colors)]
+
+  def max_fireworks(self):
+    """MB: Returns the highest reachable firework level per color, ordered by color.
+
+    A color is capped at the lowest rank whose copies have all been discarded.
+    """
+    max_fireworks = ffi.new("int[]", lib.NumColors(self._game))
+    num_colors = lib.ObsMaxFireworks(self._observation, max_fireworks)
+    return ffi.unpack(max_fireworks, num_colors)
+
   def deck_size(self):
     """Returns number of cards left in the deck."""
     return lib.ObsDeckSize(self._observation)
@@ -0,0 +1,53 @@
+# Builds the optional cffi API-mode (compiled) extension for pyhanabi.
+#
+# ABI mode (pyhanabi.try_cdef/try_load) parses pyhanabi.h at import and calls
+# into libpyhanabi through libffi's generic dispatch. The extension built here
+# compiles the same cdef and C++ sources into _pyhanabi, giving direct calls.
+# Both parse the header with pyhanabi.read_cdef, and the extension records a
+# hash of its cdef and C++ sources. pyhanabi.py picks it up automatically when
+# it is importable and the hash matches the sources beside pyhanabi.h, and
+# warns and uses ABI mode otherwise. cmake/make only rebuild libpyhanabi, so
+# rerun this after changing the C++ code.
+#
+#   python3 pyhanabi_build.py
+
+import os
+import shutil
+import tempfile
+
+import cffi
+
+from pyhanabi import read_cdef, source_files, source_hash
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PYHANABI_HEADER = os.path.join(HERE, "pyhanabi.h")
+MODULE_NAME = "_pyhanabi"
+
+
+def make_ffibuilder():
+  cdef_string = read_cdef(PYHANABI_HEADER)
+  ffibuilder = cffi.FFI()
+  ffibuilder.cdef(cdef_string)
+  # MB: pyhanabi compares this against the sources it finds, and falls back to
+  # ABI mode when the extension is out of date
+  ffibuilder.cdef("static const char *const PYHANABI_SOURCE_SHA1;")
+  sources = [f for f in source_files(PYHANABI_HEADER) if f.endswith(".cc")]
+  source = '#include "pyhanabi.h"\nstatic const char *const PYHANABI_SOURCE_SHA1 = "{}";'.format(
+      source_hash(PYHANABI_HEADER))
+  ffibuilder.set_source(MODULE_NAME, source,
+                        source_extension=".cpp",
+                        sources=sources,
+                        include_dirs=[HERE, os.path.join(HERE, "hanabi_lib")],
+                        extra_compile_args=["-O2", "-std=c++11"])
+  return ffibuilder
+
+
+if __name__ == "__main__":
+  tmpdir = tempfile.mkdtemp()
+  try:
+    extension = make_ffibuilder().compile(tmpdir=tmpdir)
+    target = os.path.join(HERE, os.path.basename(extension))
+    shutil.copy(extension, target)
+    print("Built {}".format(target))
+  finally:
+    shutil.rmtree(tmpdir)
@@ -3,6 +3,78 @@ from pyhanabi import HanabiMoveType
 from pyhanabi import HanabiCard
 num_rank = [3, 2, 2, 2, 1]
 
+
+class LatencyHistogram(object):
+  """Log-linear histogram of durations in ns: exact below 32 ns, then 16 buckets per power of two,
+  so percentiles are within 1/16 of the true value. The max is exact"""
+
+  SUB_BUCKETS = 16
+
+  def __init__(self):
+    self.counts = {}
+    self.count = 0
+    self.max = 0
+
+  @classmethod
+  def _bucket(cls, ns):
+    if ns < 2 * cls.SUB_BUCKETS:
+      return ns
+    shift = ns.bit_length() - 5
+    return shift * cls.SUB_BUCKETS + (ns >> shift)
+
+  @classmethod
+  def _bucket_range(cls, bucket):
+    """Smallest and largest ns in bucket"""
+    if bucket < 2 * cls.SUB_BUCKETS:
+      return bucket, bucket
+    shift = bucket // cls.SUB_BUCKETS - 1
+    mantissa = bucket % cls.SUB_BUCKETS + cls.SUB_BUCKETS
+    return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+  def record(self, ns):
+    bucket = self._bucket(ns)
+    self.counts[bucket] = self.counts.get(bucket, 0) + 1
+    self.count += 1
+    self.max = max(self.max, ns)
+
+  def merge(self, other):
+    for bucket, count in other.counts.items():
+      self.counts[bucket] = self.counts.get(bucket, 0) + count
+    self.count += other.count
+    self.max = max(self.max, other.max)
+    return self
+
+  def percentile(self, q):
+    """Duration in ns that q percent of the recorded durations are at or below, as its bucket's midpoint"""
+    if not self.count:
+      return 0
+    rank = max(1, -(-q * self.count // 100))
+    seen = 0
+    for bucket in sorted(self.counts):
+      seen += self.counts[bucket]
+      if seen >= rank:
+        low, high = self._bucket_range(bucket)
+        return min((low + high) // 2, self.max)
+    return self.max
+
+  def summary(self, unit=1e6):
+    """p50, p90, p99 and max, in ms by default, with the number of moves"""
+    return {'moves': self.count, 'p50': self.percentile(50) / unit, 'p90': self.percentile(90) / unit
+            , 'p99': self.percentile(99) / unit, 'max': self.max / unit}
+
+  def to_dict(self):
+    """JSON safe form, read back by from_dict"""
+    return {'counts': sorted(self.counts.items()), 'count': self.count, 'max': self.max}
+
+  @classmethod
+  def from_dict(cls, data):
+    histogram = cls()
+    histogram.counts = {bucket: count for bucket, count in data['counts']}
+    histogram.count = data['count']
+    histogram.max = data['max']
+    return histogram
+
+
 class RecordMoves(object):
 
   def __init__(self, players):
@@ -14,18 +86,23 @@ class RecordMoves(object):
     self.players = players
     self.game_stats = self.default_stats()
     self.player_stats = [self.default_stats() for _ in range(self.players)]
+    self.latency = [LatencyHistogram() for _ in range(self.players)]
 
   def reset(self, observations):
     self.recorded_observation = observations
     self.game_stats = self.default_stats()
     self.player_stats = [self.default_stats() for _ in range(self.players)]
+    self.latency = [LatencyHistogram() for _ in range(self.players)]
 
   def default_stats(self):
     return {s: 0 for s in self._stat_list}
 
-  def update(self, move, observation, action_player, elapsed_time):
-    """Update game stats by passing the action taken and the new state observation."""
+  def update(self, move, observation, action_player, elapsed_time, elapsed_ns=None):
+    """Update game stats by passing the action taken and the new state observation.
+    elapsed_ns: the move's duration, added to the player's latency histogram if given"""
     debug = False
+    if elapsed_ns is not None:
+      self.latency[action_player].record(elapsed_ns)
     self.game_stats["score"] = self._score(observation)
     self.player_stats[action_player]["score"] = self._score(observation)
     self.game_stats["progress"] = self._fireworks_score(observation["fireworks"])
@@ -87,6 +164,22 @@ class RecordMoves(object):
     if debug: print(f"record_moves.update: Game {self.game_stats}")
     if debug: print(f"record_moves.update: Players {self.player_stats}")
 
+  def update_regret(self, move, observation, action_player, card=None):
+    """Update only the regret stat, skipping the other counters. For rollouts scored by regret.
+    card: the played or discarded card as a dict, if known. Otherwise read from the discard pile."""
+    if move.type() == HanabiMoveType.DISCARD:
+      card = card or observation["discard_pile"][-1]
+      if self._critical_discard(card, observation):
+        self._update_stat("regret", self._critical_card_regret(observation, self.recorded_observation), action_player)
+    elif move.type() == HanabiMoveType.PLAY:
+      if observation["life_tokens"] < self.recorded_observation["life_tokens"]:
+        card = card or observation["discard_pile"][-1]
+        if observation["life_tokens"] == 0:
+          self._update_stat("regret", self._end_game_regret(observation, self.recorded_observation), action_player)
+        elif self._critical_discard(card, observation):
+          self._update_stat("regret", self._critical_card_regret(observation, self.recorded_observation), action_player)
+    self.recorded_observation = observation
+
   def _update_stat(self, stat, increment, action_player):
     debug = False
     self.game_stats[stat] += increment
@@ -120,7 +213,7 @@ class RecordMoves(object):
   def _critical_discard(self, card, observation):
     if self._safe_discard(card, observation):
       return False
-    num = self._count_card(card, observation["discard_pile"])
+    num = self._count_card(card, observation)
     if num == num_rank[card["rank"]]:
       # Card rank starts at 0, fireworks 1
       if observation["fireworks"][card["color"]] < card["rank"]+1:
@@ -128,43 +221,22 @@ class RecordMoves(object):
     return False
 
   def _get_max_fireworks(self, observation):
-    # Declaration: Sourced from Ruleset
-    discarded_cards = {}
-    max_fireworks = {'R': 5, 'Y': 5, 'G': 5, 'W': 5, 'B': 5}
-    for card in observation['discard_pile']:
-      color = card['color']
-      rank = card['rank']
-      label = str(color) + str(rank)
-      if label not in discarded_cards:
-        discarded_cards[label] = 1
-      else:
-        discarded_cards[label] += 1
-    for label in discarded_cards:
-      color = label[0]
-      rank = int(label[1])
-      number_in_discard = discarded_cards[label]
-      if number_in_discard >= num_rank[rank]:
-        if max_fireworks[color] >= rank:
-          max_fireworks[color] = rank
-    return max_fireworks
-
-  def _count_card(self, card, pile):
-    num = 0
-    for discarded_card in pile:
-      if discarded_card["rank"] == card["rank"] and discarded_card["color"] == card["color"]:
-        num += 1
-    return num
+    # MB: Shared with Ruleset: read from environment observations, where the game state tracks it on each
+    # discard, or computed from the discard pile for plain dicts. Imported here as ruleset imports rl_env
+    from agents.rule_based.ruleset import get_max_fireworks
+    return get_max_fireworks(observation)
+
+  def _count_card(self, card, observation):
+    from agents.rule_based.ruleset import get_discard_counts
+    return get_discard_counts(observation)[card["color"]][card["rank"]]
 
   def _safe_discard(self, card, observation):
     # If firework is already passed this rank
     if observation["fireworks"][card["color"]] >= card["rank"]+1:
       return True
-    # If a firework is already cut off
-    for rank in range(observation["fireworks"][card["color"]], card["rank"]):
-      check_card = {'color': card["color"], "rank": rank}
-      num = self._count_card(check_card, observation["discard_pile"])
-      if num == num_rank[rank]:
-        return True
+    # If a firework is already cut off: some rank between the firework and this card has every copy discarded
+    if self._get_max_fireworks(observation)[card["color"]] < card["rank"]:
+      return True
     return False
 
   def regret(self):
@@ -6,7 +6,9 @@ from __future__ import division
 import pyhanabi
 from pyhanabi import color_char_to_idx, HanabiMoveType
 
+import collections.abc
 import time
+import numpy as np
 from record_moves import RecordMoves
 
 MOVE_TYPES = [_.name for _ in pyhanabi.HanabiMoveType]
@@ -56,6 +58,155 @@ class Environment(object):
     raise NotImplementedError("Not implemented in Abstract Base class")
 
 
+class LazyObservation(collections.abc.MutableMapping):
+  """Observation dict whose values are built from the backend on first access.
+
+  Building every key means converting each legal move, card and hint into
+  Python dicts, for every player on every step, even though usually only the
+  acting player's observation is read. The backend HanabiObservation is a
+  snapshot of the state, so each key can safely be materialized later, and is
+  then cached. Values that are read from the live state rather than the
+  observation (current_player, turns_to_play, fireworks) are set eagerly.
+  """
+
+  # Key order matches the dict historically returned by the environment
+  _KEYS = ("current_player", "current_player_offset", "life_tokens",
+           "information_tokens", "num_players", "deck_size", "turns_to_play",
+           "fireworks", "legal_moves", "legal_moves_as_int", "observed_hands",
+           "discard_pile", "card_knowledge", "pyhanabi", "discard_counts",
+           "max_fireworks")
+  _LAZY_KEYS = frozenset(("current_player_offset", "life_tokens",
+                          "information_tokens", "num_players", "deck_size",
+                          "legal_moves", "legal_moves_as_int", "observed_hands",
+                          "discard_pile", "card_knowledge", "discard_counts",
+                          "max_fireworks"))
+
+  def __init__(self, observation, game, values):
+    """Args:
+      observation: A `pyhanabi.HanabiObservation` object.
+      game: `pyhanabi.HanabiGame`, used to compute move uids.
+      values: dict, eagerly computed keys.
+    """
+    self._observation = observation
+    self._game = game
+    self._values = values
+    self._pending = set(self._LAZY_KEYS)
+    # Features derived from this observation by agents (e.g. Ruleset beliefs).
+    # Safe to cache since the backend observation never changes.
+    self.features = {}
+
+  @classmethod
+  def from_state(cls, state, game, observation):
+    """Observation of state from the perspective of observation's player.
+
+    Args:
+      state: `pyhanabi.HanabiState` the observation was made from.
+      game: `pyhanabi.HanabiGame`, used to compute move uids.
+      observation: A `pyhanabi.HanabiObservation` object.
+    """
+    obs_dict = {}
+    obs_dict["current_player"] = state.cur_player()
+    obs_dict["turns_to_play"] = state.turns_to_play()
+    obs_dict["fireworks"] = {}
+    fireworks = state.fireworks()
+    for color, firework in zip(pyhanabi.COLOR_CHAR, fireworks):
+      obs_dict["fireworks"][color] = firework
+    # Edits to framework introducing ReturnCard and DealSpecific broke observation encoding
+    # obs_dict["vectorized"] = self.observation_encoder.encode(observation)
+    obs_dict["pyhanabi"] = observation
+    # Remaining keys are converted from the backend observation when first read
+    return cls(observation, game, obs_dict)
+
+  def __getitem__(self, key):
+    if key in self._values:
+      return self._values[key]
+    if key not in self._pending:
+      raise KeyError(key)
+    value = getattr(self, "_load_" + key)()
+    self._values[key] = value
+    self._pending.discard(key)
+    return value
+
+  def __setitem__(self, key, value):
+    self._pending.discard(key)
+    self._values[key] = value
+
+  def __delitem__(self, key):
+    if key in self._pending:
+      self._pending.discard(key)
+    else:
+      del self._values[key]
+
+  def __contains__(self, key):
+    return key in self._values or key in self._pending
+
+  def __iter__(self):
+    for key in self._KEYS:
+      if key in self:
+        yield key
+    for key in list(self._values):
+      if key not in self._KEYS:
+        yield key
+
+  def __len__(self):
+    return len(self._values) + len(self._pending)
+
+  def __repr__(self):
+    return repr(dict(self))
+
+  def _load_current_player_offset(self):
+    return self._observation.cur_player_offset()
+
+  def _load_life_tokens(self):
+    return self._observation.life_tokens()
+
+  def _load_information_tokens(self):
+    return self._observation.information_tokens()
+
+  def _load_num_players(self):
+    return self._observation.num_players()
+
+  def _load_deck_size(self):
+    return self._observation.deck_size()
+
+  def _load_legal_moves(self):
+    return [move.to_dict() for move in self._observation.legal_moves()]
+
+  def _load_legal_moves_as_int(self):
+    return [self._game.get_move_uid(move)
+            for move in self._observation.legal_moves()]
+
+  def _load_observed_hands(self):
+    return [[card.to_dict() for card in player_hand]
+            for player_hand in self._observation.observed_hands()]
+
+  def _load_discard_pile(self):
+    return [card.to_dict() for card in self._observation.discard_pile()]
+
+  def _load_discard_counts(self):
+    # Maintained incrementally by the game state, not recounted from the pile
+    return dict(zip(pyhanabi.COLOR_CHAR, self._observation.discard_counts()))
+
+  def _load_max_fireworks(self):
+    return dict(zip(pyhanabi.COLOR_CHAR, self._observation.max_fireworks()))
+
+  def _load_card_knowledge(self):
+    # Return hints received (MB: Surely this can be improved with previous knowledge?)
+    card_knowledge = []
+    for player_hints in self._observation.card_knowledge():
+      player_hints_as_dicts = []
+      for hint in player_hints:
+        hint_d = {}
+        if hint.color() is not None:
+          hint_d["color"] = pyhanabi.color_idx_to_char(hint.color())
+        else:
+          hint_d["color"] = None
+        hint_d["rank"] = hint.rank()
+        player_hints_as_dicts.append(hint_d)
+      card_knowledge.append(player_hints_as_dicts)
+    return card_knowledge
+
+
 class HanabiEnv(Environment):
   """RL interface to a Hanabi environment.
 
@@ -97,7 +248,7 @@ class HanabiEnv(Environment):
     #    self.game, pyhanabi.ObservationEncoderType.CANONICAL)
     self.players = self.game.num_players()
     self.record_moves = RecordMoves(self.players)
-    self.start_time = time.time()
+    self.start_time = time.perf_counter_ns()
 
   def reset(self):
     """Resets the environment for a new game."""
@@ -107,6 +258,8 @@ class HanabiEnv(Environment):
     obs = self._make_observation_all_players()
     obs["current_player"] = self.state.cur_player()
     self.record_moves.reset(obs["player_observations"][obs["current_player"]])
+    # MB: The first move's time starts with the game, not with making the environment
+    self.start_time = time.perf_counter_ns()
     return obs
 
   def vectorized_observation_shape(self):
@@ -128,7 +281,8 @@ class HanabiEnv(Environment):
 
   def step(self, action):
     debug = False
-    elapsed_time = int(round((time.time() - self.start_time)*1000))
+    elapsed_ns = time.perf_counter_ns() - self.start_time
+    elapsed_time = int(round(elapsed_ns / 1e6))
 
     if isinstance(action, dict):
       # Convert dict action HanabiMove
@@ -155,13 +309,13 @@ class HanabiEnv(Environment):
 
     observations = self._make_observation_all_players()
 
-    self.record_moves.update(move, observations["player_observations"][action_player], action_player, elapsed_time)
+    self.record_moves.update(move, observations["player_observations"][action_player], action_player, elapsed_time, elapsed_ns)
     if debug: self.print_state()
     if debug: print(f"rl_env.step: Game Stats: {self.record_moves.game_stats}")
     if debug: print(f"rl_env.step: Player Stats: {self.record_moves.player_stats}")
 
     reward = self.score()
-    self.start_time = time.time()
+    self.start_time = time.perf_counter_ns()
     info = {}
     return (observations, reward, done, info)
 
@@ -177,6 +331,10 @@ class HanabiEnv(Environment):
   def player_stats(self,player):
     return self.record_moves.player_stats[player]
 
+  def move_latency(self, player):
+    """LatencyHistogram of player's move times this game"""
+    return self.record_moves.latency[player]
+
   def _make_observation_all_players(self):
     """Make observation for all players.
 
@@ -199,54 +357,9 @@ class HanabiEnv(Environment):
       observation: A `pyhanabi.HanabiObservation` object.
 
     Returns:
-      obs_dict: dict, mapping from HanabiObservation to a dict.
+      obs_dict: LazyObservation, dict-like mapping from HanabiObservation.
     """
-    obs_dict = {}
-    obs_dict["current_player"] = self.state.cur_player()
-    obs_dict["current_player_offset"] = observation.cur_player_offset()
-    obs_dict["life_tokens"] = observation.life_tokens()
-    obs_dict["information_tokens"] = observation.information_tokens()
-    obs_dict["num_players"] = observation.num_players()
-    obs_dict["deck_size"] = observation.deck_size()
-    obs_dict["turns_to_play"] = self.state.turns_to_play()
-
-    obs_dict["fireworks"] = {}
-    fireworks = self.state.fireworks()
-    for color, firework in zip(pyhanabi.COLOR_CHAR, fireworks):
-      obs_dict["fireworks"][color] = firework
-
-    obs_dict["legal_moves"] = []
-    obs_dict["legal_moves_as_int"] = []
-    for move in observation.legal_moves():
-      obs_dict["legal_moves"].append(move.to_dict())
-      obs_dict["legal_moves_as_int"].append(self.game.get_move_uid(move))
-
-    obs_dict["observed_hands"] = []
-    for player_hand in observation.observed_hands():
-      cards = [card.to_dict() for card in player_hand]
-      obs_dict["observed_hands"].append(cards)
-
-    obs_dict["discard_pile"] = [
-        card.to_dict() for card in observation.discard_pile()
-    ]
-    # Return hints received (MB: Surely this can be improved with previous knowledge?)
-    obs_dict["card_knowledge"] = []
-    for player_hints in observation.card_knowledge():
-      player_hints_as_dicts = []
-      for hint in player_hints:
-        hint_d = {}
-        if hint.color() is not None:
-          hint_d["color"] = pyhanabi.color_idx_to_char(hint.color())
-        else:
-          hint_d["color"] = None
-        hint_d["rank"] = hint.rank()
-        player_hints_as_dicts.append(hint_d)
-      obs_dict["card_knowledge"].append(player_hints_as_dicts)
-    # ipdb.set_trace()
-    # Edits to framework introducing ReturnCard and DealSpecific broke observation encoding
-    # obs_dict["vectorized"] = self.observation_encoder.encode(observation)
-    obs_dict["pyhanabi"] = observation
-    return obs_dict
+    return LazyObservation.from_state(self.state, self.game, observation)
 
   def _build_move(self, action):
     """Build a move from an action dict.
@@ -316,13 +429,157 @@ class HanabiEnv(Environment):
   def print_state(self):
     print("------------------ STATE -------------------\n{}\n--------------- END STATE ------------------".format(self.state))
 
-def make(environment_name="Hanabi-Full", num_players=2, pyhanabi_path=None):
+class VectorHanabiEnv(Environment):
+  """N independent Hanabi games stepped in lockstep.
+
+  Rather than a dict per player per game, reset and step return a dict of
+  batched numpy arrays with a leading num_games axis:
+    - current_player: (N,) acting player, absolute index.
+    - fireworks: (N, colors) fireworks level per color.
+    - information_tokens, life_tokens, deck_size: (N,)
+    - legal_moves: (N, max_moves) 1 for each legal move uid of the acting
+      player, all 0 once the game is done.
+    - card_knowledge: (N, players, hand_size, colors, ranks) 1 where the card
+      in a player's hand is plausible given their hints (absolute players).
+    - done: (N,) whether each game has finished.
+
+  Agents that need the dict interface can read a single game with
+  observation(game_index).
+
+  ```python
+
+  environment = rl_env.make_vector(num_players=3, num_games=1000)
+  batch = environment.reset()
+  while not batch["done"].all():
+      actions = ...  # one move uid or action dict per game
+      batch, rewards, done, info = environment.step(actions)
+  ```
+  """
+
+  def __init__(self, config, num_games):
+    """Creates num_games games sharing the given game configuration.
+
+    Args:
+      config: dict, With parameters for the game. See HanabiEnv.
+      num_games: int, Number of independent games.
+    """
+    assert isinstance(config, dict), "Expected config to be of type dict."
+    self.game = pyhanabi.HanabiGame(config)
+    self.num_games = num_games
+    self.players = self.game.num_players()
+    self.num_colors = self.game.num_colors()
+    self.num_ranks = self.game.num_ranks()
+    self.hand_size = self.game.hand_size()
+    self.max_moves = self.game.max_moves()
+    # Moves are immutable, so build each uid's move (and its dict form) once
+    self._moves = [self.game.get_move(uid) for uid in range(self.max_moves)]
+    self._uid_by_action = {self._action_key(move.to_dict()): uid
+                           for uid, move in enumerate(self._moves)}
+    self.states = []
+    self.done = np.zeros(num_games, dtype=bool)
+
+  def reset(self):
+    """Resets all games."""
+    self.states = []
+    for _ in range(self.num_games):
+      state = self.game.new_initial_state()
+      while state.cur_player() == pyhanabi.CHANCE_PLAYER_ID:
+        state.deal_random_card()
+      self.states.append(state)
+    self.done = np.array([state.is_terminal() for state in self.states])
+    return self._make_batch()
+
+  def step(self, actions):
+    """Apply one action in every game that is not done.
+
+    Args:
+      actions: sequence of num_games actions, each a move uid (int) or an
+        action dict. Actions for finished games are ignored.
+
+    Returns:
+      batch: dict of batched numpy arrays, see class docstring.
+      rewards: (N,) score of each game.
+      done: (N,) whether each game has finished.
+      info: dict, Optional debugging information.
+    """
+    assert len(actions) == self.num_games, (
+        "Expected {} actions, got: {}".format(self.num_games, len(actions)))
+    for index, (state, action) in enumerate(zip(self.states, actions)):
+      if self.done[index]:
+        continue
+      state.apply_move(self._moves[self.action_to_uid(state, action)])
+      while state.cur_player() == pyhanabi.CHANCE_PLAYER_ID:
+        state.deal_random_card()
+      self.done[index] = state.is_terminal()
+    return self._make_batch(), self.scores(), self.done.copy(), {}
+
+  def action_to_uid(self, state, action):
+    """Convert an int or action dict into a legal move uid for state."""
+    if isinstance(action, dict):
+      uid = self._uid_by_action.get(self._action_key(action), -1)
+    else:
+      uid = int(action)
+    assert 0 <= uid < self.max_moves and state.move_is_legal(self._moves[uid]), (
+        "Illegal action: {}".format(action))
+    return uid
+
+  def observation(self, game_index, player=None):
+    """Dict observation of a single game, as returned by HanabiEnv.
+
+    Args:
+      game_index: int, index of the game.
+      player: int, observing player. Defaults to the acting player.
+    """
+    state = self.states[game_index]
+    if player is None:
+      player = state.cur_player()
+    return LazyObservation.from_state(state, self.game,
+                                      state.observation(player))
+
+  def scores(self):
+    return np.array([state.score() for state in self.states])
+
+  def progress(self):
+    return np.array([state.progress() for state in self.states])
+
+  def _make_batch(self):
+    n = self.num_games
+    batch = {
+        "current_player": np.empty(n, dtype=np.int32),
+        "fireworks": np.empty((n, self.num_colors), dtype=np.int32),
+        "information_tokens": np.empty(n, dtype=np.int32),
+        "life_tokens": np.empty(n, dtype=np.int32),
+        "deck_size": np.empty(n, dtype=np.int32),
+        "legal_moves": np.empty((n, self.max_moves), dtype=np.int32),
+        "card_knowledge": np.empty((n, self.players, self.hand_size,
+                                    self.num_colors, self.num_ranks),
+                                   dtype=np.int32),
+        "done": self.done.copy(),
+    }
+    for index, state in enumerate(self.states):
+      batch["current_player"][index] = state.cur_player()
+      batch["fireworks"][index] = state.fireworks()
+      batch["information_tokens"][index] = state.information_tokens()
+      batch["life_tokens"][index] = state.life_tokens()
+      batch["deck_size"][index] = state.deck_size()
+      state.legal_moves_mask(batch["legal_moves"][index])
+      for player in range(self.players):
+        state.hand_knowledge_mask(player, batch["card_knowledge"][index, player])
+    return batch
+
+  @staticmethod
+  def _action_key(action):
+    return tuple(sorted(action.items()))
+
+
+def make(environment_name="Hanabi-Full", num_players=2, pyhanabi_path=None, seed=-1):
   """Make an environment.
 
   Args:
     environment_name: str, Name of the environment to instantiate.
     num_players: int, Number of players in this game.
     pyhanabi_path: str, absolute path to header files for c code linkage.
+    seed: int, Random seed for the deals. -1 to use the system random device.
 
   Returns:
     env: An `Environment` object.
@@ -330,77 +587,104 @@ def make(environment_name="Hanabi-Full", num_players=2, pyhanabi_path=None):
   Raises:
     ValueError: Unknown environment name.
   """
+  load_pyhanabi(pyhanabi_path)
+  config = make_config(environment_name, num_players)
+  config["seed"] = seed
+  return HanabiEnv(config=config)
+
+
+def make_vector(environment_name="Hanabi-Full", num_players=2, num_games=1,
+                pyhanabi_path=None):
+  """Make a vectorized environment of num_games independent games.
+
+  Args:
+    environment_name: str, Name of the environment to instantiate.
+    num_players: int, Number of players in each game.
+    num_games: int, Number of games stepped in lockstep.
+    pyhanabi_path: str, absolute path to header files for c code linkage.
+
+  Returns:
+    env: A `VectorHanabiEnv` object.
+  """
+  load_pyhanabi(pyhanabi_path)
+  return VectorHanabiEnv(make_config(environment_name, num_players), num_games)
+
 
+def load_pyhanabi(pyhanabi_path=None):
+  """Load the pyhanabi header and library from pyhanabi_path, if given."""
   if pyhanabi_path is not None:
     prefixes=(pyhanabi_path,)
     assert pyhanabi.try_cdef(prefixes=prefixes), "cdef failed to load"
     assert pyhanabi.try_load(prefixes=prefixes), "library failed to load"
 
+
+def make_config(environment_name="Hanabi-Full", num_players=2):
+  """Game config for a named environment.
+
+  Raises:
+    ValueError: Unknown environment name.
+  """
   if (environment_name == "Hanabi-Full" or
       environment_name == "Hanabi-Full-CardKnowledge"):
-    return HanabiEnv(
-        config={
-            "colors":
-                5,
-            "ranks":
-                5,
-            "players":
-                num_players,
-            "max_information_tokens":
-                8,
-            "max_life_tokens":
-                3,
-            "observation_type":
-                pyhanabi.AgentObservationType.CARD_KNOWLEDGE.value,
-            'random_start_player':
-                True
-        })
+    return {
+        "colors":
+            5,
+        "ranks":
+            5,
+        "players":
+            num_players,
+        "max_information_tokens":
+            8,
+        "max_life_tokens":
+            3,
+        "observation_type":
+            pyhanabi.AgentObservationType.CARD_KNOWLEDGE.value,
+        'random_start_player':
+            True
+    }
   elif environment_name == "Hanabi-Full-Minimal":
-    return HanabiEnv(
-        config={
-            "colors": 5,
-            "ranks": 5,
-            "players": num_players,
-            "max_information_tokens": 8,
-            "max_life_tokens": 3,
-            "observation_type": pyhanabi.AgentObservationType.MINIMAL.value
-        })
+    return {
+        "colors": 5,
+        "ranks": 5,
+        "players": num_players,
+        "max_information_tokens": 8,
+        "max_life_tokens": 3,
+        "observation_type": pyhanabi.AgentObservationType.MINIMAL.value
+    }
   elif environment_name == "Hanabi-Small":
-    return HanabiEnv(
-        config={
-            "colors":
-                2,
-            "ranks":
-                5,
-            "players":
-                num_players,
-            "hand_size":
-                2,
-            "max_information_tokens":
-                3,
-            "max_life_tokens":
-                1,
-            "observation_type":
-                pyhanabi.AgentObservationType.CARD_KNOWLEDGE.value
-        })
+    return {
+        "colors":
+            2,
+        "ranks":
+            5,
+        "players":
+            num_players,
+        "hand_size":
+            2,
+        "max_information_tokens":
+            3,
+        "max_life_tokens":
+            1,
+        "observation_type":
+            pyhanabi.AgentObservationType.CARD_KNOWLEDGE.value
+    }
   elif environment_name == "Hanabi-Very-Small":
-    return HanabiEnv(
-        config={
-            "colors":
-                1,
-            "ranks":
-                5,
-            "players":
-                num_players,
-            "hand_size":
-                2,
-            "max_information_tokens":
-                3,
-            "max_life_tokens":
-                1,
-            "observation_type":
-                pyhanabi.AgentObservationType.CARD_KNOWLEDGE.value
-        })
+    return {
+        "colors":
+            1,
+        "ranks":
+            5,
+        "players":
+            num_players,
+        "hand_size":
+            2,
+        "max_information_tokens":
+            3,
+        "max_life_tokens":
+            1,
+        "observation_type":
+            pyhanabi.AgentObservationType.CARD_KNOWLEDGE.value
+    }
   else:
     raise ValueError("Unknown environment {}".format(environment_name))
 
@@ -463,6 +747,7 @@ class Agent(object):
         {'current_player': 0,
          'current_player_offset': 1,
          'deck_size': 40,
+         'discard_counts': {'B': [0, 0, 0, 0, 0], ...},
          'discard_pile': [],
          'fireworks': {'B': 0,
                    'G': 0,
@@ -472,6 +757,7 @@ class Agent(object):
          'information_tokens': 8,
          'legal_moves': [],
          'life_tokens': 3,
+         'max_fireworks': {'B': 5, ...},
          'observed_hands': [[{'color': None, 'rank': -1},
                          {'color': None, 'rank': -1},
                          {'color': None, 'rank': -1},
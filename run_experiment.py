@@ -3,7 +3,16 @@
 from __future__ import print_function
 import sys
 import getopt
+import contextlib
+import itertools
+import multiprocessing
+import os
+import random
+import pyhanabi
 from rl_env import make
+from experiment_results import make_results_writer, ExperimentCheckpoint
+from record_moves import LatencyHistogram
+from experiment_stats import mean_interval, paired_comparison
 from agents.rule_based.rule_based_agents import VanDenBerghAgent
 from agents.rule_based.rule_based_agents import OuterAgent
 from agents.rule_based.rule_based_agents import InnerAgent
@@ -13,6 +22,7 @@ from agents.rule_based.rule_based_agents import LegalRandomAgent
 from agents.rule_based.rule_based_agents import FlawedAgent
 from agents.rule_based.rule_based_agents import MuteAgent
 from agents.mcts.mcts_agent import MCTSAgent
+from agents.mcts.mcts_profiler import SearchProfiler
 from agents.human_agent import HumanAgent
 
 AGENT_CLASSES = {'VanDenBerghAgent': VanDenBerghAgent,'FlawedAgent':FlawedAgent, 'MCTSAgent': MCTSAgent
@@ -25,68 +35,184 @@ class Runner(object):
   def __init__(self, flags):
     """Initialize runner."""
     self.flags = flags
-    self.agent_config = {'players': flags['players'], 'player_id':0, 'mcts_types':flags['mcts_types']}
+    self.agent_config = {'players': flags['players'], 'player_id':0, 'mcts_types':flags['mcts_types']
+                         , 'profile': flags['profile']}
     self.environment = make('Hanabi-Full', num_players=flags['players'])
     self.agent_classes = [AGENT_CLASSES[agent_class] for agent_class in flags['agent_classes']]
 
-  def run(self):
-    """Run episodes."""
-    game_stats = []
-    player_stats = []
-    agents = []
+  def run(self, stop=None):
+    """Run episodes, up to flags['num_episodes']. stop(scores) may end the run early by returning its reason.
+    Returns the episode scores"""
+    results = []
+    stop_reason = None
+    with contextlib.closing(self.episodes()) as episodes:
+      for result in episodes:
+        results.append(result)
+        stop_reason = stop([r['game_stats']['score'] for r in results]) if stop is not None else None
+        if stop_reason is not None:
+          break
+    self.report(results, stop_reason or 'max_episodes')
+    return [r['game_stats']['score'] for r in results]
 
-    # MB: Pass absolute player_id upfront to all agents (MCTS needs this for forward model)
-    for i in range(len(self.agent_classes)):
-      self.agent_config.update({'player_id': i}) #change player_id
-      agents.append(self.agent_classes[i](self.agent_config))
-      player_stats.append([])
+  def episodes(self):
+    """Episode results in episode order: those already in the checkpoint when resuming, then played ones.
+    Played episodes go to the results file and checkpoint as they finish"""
+    results_writer = make_results_writer(self.flags['results']) if self.flags['results'] else None
+    checkpoint = ExperimentCheckpoint(self.flags['checkpoint'], self.flags['checkpoint_every'], results_writer) if self.flags['checkpoint'] else None
+    # Episodes finished before a resume count as played here; their records are already in the results file
+    finished = checkpoint.start(self.flags, self.flags['resume']) if checkpoint is not None else []
+    finished = finished[:self.flags['num_episodes']]
+    # MB: Results arrive in episode order, whether played here or by the worker pool
+    played = self._episode_results(start=len(finished))
+    try:
+      for episode, result in enumerate(itertools.chain(finished, played)):
+        if episode >= len(finished):
+          record = self.episode_record(episode, result) if results_writer is not None else None
+          # With a checkpoint, records reach the results file as their episodes are checkpointed
+          if checkpoint is not None:
+            checkpoint.add(episode, result, record)
+          elif record is not None:
+            results_writer.write(record)
+        yield result
+    finally:
+      # A stopped run ends the worker pool here
+      played.close()
+      if checkpoint is not None:
+        checkpoint.close()
+      if results_writer is not None:
+        results_writer.close()
 
-    print("]") # end mcts_config
-    print(",progress=[", end="")
+  def report(self, results, stop_reason):
+    """Print the Experiment for the episode results"""
+    game_stats = []
+    player_stats = [[] for _ in self.agent_classes]
+    agent_stats = [{} for _ in self.agent_classes]
+    move_latency = [LatencyHistogram() for _ in self.agent_classes]
+    phase_latency = [{} for _ in self.agent_classes]
     errors = 0
 
-
-    for episode in range(flags['num_episodes']):
-      done = False
-      observations = self.environment.reset()
-      try:
-        while not done:
-          for agent_id, agent in enumerate(agents):
-            observation = observations['player_observations'][agent_id]
-            # MB: MCTSAgent needs to be passed full state to act as base for MCTS
-            # MB: Note that it replaces it's hand before each rollout so not 'cheating' by knowing the full state
-            if isinstance(agent, MCTSAgent):
-              action = agent.act(observation, self.environment.state)
-            else:
-              action = agent.act(observation)
-            if observation['current_player'] == agent_id:
-              assert action is not None
-              current_player_action = action
-            else:
-              assert action is None
-          observations, reward, done, unused_info = self.environment.step(current_player_action)
-        print(self.environment.progress(), end=",")
-        game_stats.append(self.environment.game_stats())
-        for i in range(len(self.agent_classes)):
-          player_stats[i].append(self.environment.player_stats(i))
-      except Exception as e:
-        raise e
-        errors += 1
+    print("Experiment(")
+    print(f"flags = {self.flags}")
+    print(",mcts_configs = [")
+    print("]") # end mcts_config
+    print(",progress=[", end="")
+    for result in results:
+      print(result['progress'], end=",")
+      game_stats.append(result['game_stats'])
+      for i in range(len(self.agent_classes)):
+        player_stats[i].append(result['player_stats'][i])
+        for key, value in result['agent_stats'][i].items():
+          agent_stats[i][key] = agent_stats[i].get(key, 0) + value
+        # Checkpoints written before latency histograms were kept have none
+        if 'move_latency' in result:
+          move_latency[i].merge(LatencyHistogram.from_dict(result['move_latency'][i]))
+          for phase, histogram in result['phase_latency'][i].items():
+            phase_latency[i].setdefault(phase, LatencyHistogram()).merge(LatencyHistogram.from_dict(histogram))
 
     print("]")
     print(f",scores = {[g['score'] for g in game_stats]}")
     print(f",stats_keys={list(game_stats[0].keys())}")
     print(f",game_stats = {self.simplify_stats(game_stats)}")
     print(f",player_stats = {[self.simplify_stats(p) for p in player_stats]}")
-    avg_progress = sum([g["progress"] for g in game_stats]) / flags['num_episodes']
-    avg_score = sum([g["score"] for g in game_stats]) / flags['num_episodes']
-    avg_time = sum([p["elapsed_time"]/max(p["moves"], 1) for p in player_stats[0]]) / flags['num_episodes']
+    print(f",agent_stats = {agent_stats}")
+    print(f",move_latency_ms = {[histogram.summary() for histogram in move_latency]}")
+    if any(phase_latency):
+      # Per move time of each search phase, for the agents that expose a move_profile
+      print(f",phase_latency_ms = {[{phase: h.summary() for phase, h in phases.items()} for phases in phase_latency]}")
+    if self.flags['profile']:
+      # Where each MCTS player's search time went: share per phase, and counters per searched move
+      print(f",phase_profile = {[SearchProfiler.breakdown(stats) for stats in agent_stats]}")
+    if self.flags['early_stop']:
+      print(f",episodes={len(results)}")
+      print(f",stop_reason={stop_reason!r}")
+    avg_progress = sum([g["progress"] for g in game_stats]) / len(results)
+    avg_score = sum([g["score"] for g in game_stats]) / len(results)
+    avg_time = sum([p["elapsed_time"]/max(p["moves"], 1) for p in player_stats[0]]) / len(results)
     print(f",avg_progress={avg_progress}")
     print(f",avg_score={avg_score}")
     print(f",avg_time={avg_time}")
     print(f",errors={errors}")
     print("),")
 
+  def _episode_results(self, start=0):
+    """run_episode for every episode from start in order, across a pool of flags['workers'] processes if more than one"""
+    episodes = range(start, self.flags['num_episodes'])
+    if self.flags['workers'] <= 1:
+      for episode in episodes:
+        yield self.run_episode(episode)
+      return
+    with multiprocessing.Pool(self.flags['workers'], initializer=_init_worker, initargs=(self.flags,)) as pool:
+      for result in pool.imap(_run_worker_episode, episodes):
+        yield result
+
+  def episode_seed(self, episode):
+    return (self.flags['seed'] + episode) % 2**31
+
+  def run_episode(self, episode):
+    """Play one episode with its own seeded environment and agents, so it plays the same in any process.
+    Returns the episode's progress and stats"""
+    seed = self.episode_seed(episode)
+    random.seed(seed)
+    self.environment = make('Hanabi-Full', num_players=self.flags['players'], seed=seed)
+    agents = []
+    # MB: Pass absolute player_id upfront to all agents (MCTS needs this for forward model)
+    for i in range(len(self.agent_classes)):
+      self.agent_config.update({'player_id': i, 'seed': seed}) #change player_id
+      agents.append(self.agent_classes[i](self.agent_config))
+
+    done = False
+    phase_latency = [{} for _ in agents]
+    observations = self.environment.reset()
+    while not done:
+      for agent_id, agent in enumerate(agents):
+        observation = observations['player_observations'][agent_id]
+        # MB: MCTSAgent needs to be passed full state to act as base for MCTS
+        # MB: Note that it replaces it's hand before each rollout so not 'cheating' by knowing the full state
+        if isinstance(agent, MCTSAgent):
+          action = agent.act(observation, self.environment.state)
+        else:
+          action = agent.act(observation)
+        if observation['current_player'] == agent_id:
+          assert action is not None
+          current_player_action = action
+          self._record_phase_latency(agent, phase_latency[agent_id])
+        else:
+          assert action is None
+      observations, reward, done, unused_info = self.environment.step(current_player_action)
+    return {'progress': self.environment.progress()
+            , 'game_stats': self.environment.game_stats()
+            , 'player_stats': [self.environment.player_stats(i) for i in range(len(self.agent_classes))]
+            , 'agent_stats': [agent.stats() if hasattr(agent, 'stats') else {} for agent in agents]
+            , 'move_latency': [self.environment.move_latency(i).to_dict() for i in range(len(agents))]
+            , 'phase_latency': [{phase: h.to_dict() for phase, h in phases.items()} for phases in phase_latency]
+            , 'mcts_configs': [agent.mcts_config() if isinstance(agent, MCTSAgent) else None for agent in agents]
+            , 'deals': self.deals()}
+
+  def deals(self):
+    """The cards dealt in the game so far, in order, for checking that compared configurations played the same deals"""
+    return [str(item.move()) for item in self.environment.state.move_history()
+            if item.move().type() == pyhanabi.HanabiMoveType.DEAL]
+
+  @staticmethod
+  def _record_phase_latency(agent, phase_latency):
+    """Add the phase times of the agent's last move, if it exposes them, to phase_latency {phase: LatencyHistogram}"""
+    profile = agent.move_profile() if hasattr(agent, 'move_profile') else None
+    if profile is None:
+      return
+    for key, value in profile.items():
+      if key.endswith('_ms'):
+        phase_latency.setdefault(key[:-3], LatencyHistogram()).record(int(value * 1e6))
+
+  def episode_record(self, episode, result):
+    """Self-contained record of one finished episode, for the results file"""
+    return {'episode': episode, 'seed': self.episode_seed(episode), 'players': self.flags['players']
+            , 'agents': self.flags['agent_classes'], 'mcts_types': self.flags['mcts_types']
+            , 'mcts_configs': result['mcts_configs'], 'score': result['game_stats']['score']
+            , 'progress': result['progress'], 'game_stats': result['game_stats']
+            , 'player_stats': result['player_stats'], 'agent_stats': result['agent_stats']
+            , 'mean_move_latency_ms': [p['elapsed_time'] / max(p['moves'], 1) for p in result['player_stats']]
+            , 'move_latency_percentiles_ms': [LatencyHistogram.from_dict(h).summary() for h in result['move_latency']]}
+
   def simplify_stats(self, stats):
     """Extract just the numbers from the stats"""
     return [list(g.values()) for g in stats]
@@ -94,30 +220,164 @@ class Runner(object):
   def print_state(self):
     self.environment.print_state()
 
+
+_worker_runner = None
+
+def _init_worker(flags):
+  """Each pool worker keeps its own Runner"""
+  global _worker_runner
+  _worker_runner = Runner(flags)
+
+def _run_worker_episode(episode):
+  return _worker_runner.run_episode(episode)
+
+def score_stop(flags):
+  """stop(scores) for Runner.run under the early stopping flags, or None without early stopping.
+  Stops once the confidence interval on the mean score is within flags['half_width']"""
+  if not flags['early_stop']:
+    return None
+  def stop(scores):
+    if len(scores) < flags['min_episodes']:
+      return None
+    _, half_width = mean_interval(scores)
+    return 'half_width' if half_width <= flags['half_width'] else None
+  return stop
+
+def paired_stop(flags, scores):
+  """Why a --compare run can stop, or None. scores: each configuration's scores so far.
+  Every configuration's interval on its difference from the first has to be within flags['half_width'] or exclude zero"""
+  if len(scores[0]) < flags['min_episodes']:
+    return None
+  reasons = []
+  for comparison_scores in scores[1:]:
+    comparison = paired_comparison(comparison_scores, scores[0])
+    if comparison['half_width'] <= flags['half_width']:
+      reasons.append('half_width')
+    elif comparison['ci'][0] > 0 or comparison['ci'][1] < 0:
+      reasons.append('excludes_zero')
+    else:
+      return None
+  return ','.join(reasons)
+
+def run_paired(runners, flags):
+  """Play the compared configurations' episodes in step, so early stopping can watch the paired differences.
+  Each configuration plays in its own pool when flags['workers'] > 1. Returns each configuration's scores"""
+  results = [[] for _ in runners]
+  stop_reason = None
+  with contextlib.ExitStack() as stack:
+    episodes = [stack.enter_context(contextlib.closing(runner.episodes())) for runner in runners]
+    for round_results in zip(*episodes):
+      check_same_deals(round_results)
+      for runner_results, result in zip(results, round_results):
+        runner_results.append(result)
+      if flags['early_stop']:
+        stop_reason = paired_stop(flags, [[r['game_stats']['score'] for r in runner_results] for runner_results in results])
+        if stop_reason is not None:
+          break
+  for runner, runner_results in zip(runners, results):
+    runner.report(runner_results, stop_reason or 'max_episodes')
+  return [[r['game_stats']['score'] for r in runner_results] for runner_results in results]
+
+def check_same_deals(round_results):
+  """Raise if the configurations' results of one episode were not dealt the same cards.
+  The game that lasted longer deals more, so the shorter sequence has to start the longer one"""
+  deals = [result['deals'] for result in round_results if 'deals' in result]
+  for comparison_deals in deals[1:]:
+    length = min(len(deals[0]), len(comparison_deals))
+    if comparison_deals[:length] != deals[0][:length]:
+      raise RuntimeError(f"Compared configurations were dealt different cards: {deals[0][:length]} against {comparison_deals[:length]}")
+
+def comparison_flags(flags):
+  """Flags of each configuration in flags['compare'], the first being the reference.
+  An entry is mcts_types, or agent:mcts_types to also change player 0's agent class.
+  Every configuration keeps the seed, so episode i deals the same cards to each"""
+  comparisons = []
+  for index, entry in enumerate(flags['compare'].split(',')):
+    agent, _, mcts_types = entry.rpartition(':')
+    comparison = dict(flags, agent=agent or flags['agent'], mcts_types=mcts_types)
+    comparison['agent_classes'] = [comparison['agent']] + flags['agent_classes'][1:]
+    comparison['checkpoint'] = comparison_path(flags['checkpoint'], index)
+    comparison['results'] = comparison_path(flags['results'], index)
+    comparisons.append(comparison)
+  return comparisons
+
+def comparison_path(path, index):
+  """Each compared configuration checkpoints and writes its results to its own file"""
+  if not path:
+    return path
+  root, extension = os.path.splitext(path)
+  return f"{root}_{index}{extension}"
+
+def paired_summary(comparisons, scores):
+  """Paired score difference of each configuration against the first, which played the same deals"""
+  summary = []
+  for comparison, comparison_scores in zip(comparisons[1:], scores[1:]):
+    result = paired_comparison(comparison_scores, scores[0])
+    summary.append({'config': f"{comparison['agent']}:{comparison['mcts_types']}"
+                    , 'reference': f"{comparisons[0]['agent']}:{comparisons[0]['mcts_types']}"
+                    , **{key: round(value, 3) if isinstance(value, float) else value for key, value in result.items()}
+                    , 'ci': tuple(round(bound, 3) for bound in result['ci'])})
+  return summary
+
 if __name__ == "__main__":
   # MB: agent: Player of interest. agent: fill in remaining spaces
   flags = {'players': 3, 'num_episodes': 1
     ,'agent':'VanDenBerghAgent', 'agents':'VanDenBerghAgent'
-    , 'mcts_types': '000'}
+    , 'mcts_types': '000', 'workers': 1, 'seed': -1, 'results': ''
+    , 'checkpoint': '', 'checkpoint_every': 1, 'resume': False, 'profile': False, 'compare': ''
+    , 'early_stop': False, 'half_width': 0.5, 'min_episodes': 20}
   options, arguments = getopt.getopt(sys.argv[1:], '',
                                      ['players=',
                                       'num_episodes=',
                                       'agent=',
                                       'agents=',
-                                      'mcts_types='])
+                                      'mcts_types=',
+                                      'workers=',
+                                      'seed=',
+                                      'results=',
+                                      'checkpoint=',
+                                      'checkpoint_every=',
+                                      'resume',
+                                      'profile',
+                                      'compare=',
+                                      'early_stop',
+                                      'half_width=',
+                                      'min_episodes='])
   if arguments:
     sys.exit('usage: rl_env_example.py [options]\n'
              '--players       number of players in the game.\n'
              '--num_episodes  number of game episodes to run.\n'
              '--agent  class name of single agent. Supported: {}\n'
              '--agents  class name of pair of agents to play against\n'
-             '--mcts_types 000 each character is the type of the mcts agent in that position, see mcts_agent._edit_mcts_config'
+             '--mcts_types 000 each character is the type of the mcts agent in that position, see mcts_agent._edit_mcts_config\n'
+             '--workers  number of processes playing episodes in parallel.\n'
+             '--seed  seed of the first episode, episode i uses seed + i. -1 draws one.\n'
+             '--results  file to append a record to as each episode finishes: .csv for CSV, else JSON lines.\n'
+             '--checkpoint  file logging finished episodes, every --checkpoint_every episodes.\n'
+             '--resume  carry on from --checkpoint, skipping the episodes it has.\n'
+             '--profile  time each phase of MCTS agent searches, reported in agent_stats and phase_profile.\n'
+             '--compare  000,100 or MCTSAgent:000,VanDenBerghAgent:000 configurations to play the same deals,\n'
+             '           reporting score differences to the first with 95% confidence intervals.\n'
+             '--early_stop  stop once the 95% interval on the mean score (with --compare, on each paired difference)\n'
+             '              is within --half_width or (paired) excludes zero, after --min_episodes. --num_episodes is the most played.'
              ''.format(' or '.join(AGENT_CLASSES.keys())))
 
   # Convert any extra options into the flags
   for flag, value in options:
     flag = flag[2:]  # Strip leading --
-    flags[flag] = type(flags[flag])(value)
+    if isinstance(flags[flag], bool):
+      flags[flag] = True
+    else:
+      flags[flag] = type(flags[flag])(value)
+
+  # Episode seeds follow from one base seed, printed with the flags so a run can be repeated
+  if flags['seed'] == -1 and flags['resume'] and flags['checkpoint']:
+    checkpoint_flags, _ = ExperimentCheckpoint.read(comparison_path(flags['checkpoint'], 0) if flags['compare']
+                                                    else flags['checkpoint'])
+    if checkpoint_flags is not None:
+      flags['seed'] = checkpoint_flags['seed']
+  if flags['seed'] == -1:
+    flags['seed'] = random.randrange(2**31)
 
   # agent_classes lists the players of the game
   flags['agent_classes'] = [flags['agent']] + [flags['agents'] for _ in range(1, flags["players"])]
@@ -127,9 +387,14 @@ if __name__ == "__main__":
     sys.exit(f'Number of agent classes:{len(flags["agent_classes"])} not same as number of players: {flags["players"]}')
 
   #Print the config
-  print("experiments = [Experiment(")
-  print(f"flags = {flags}")
-  print(",mcts_configs = [")
-  runner = Runner(flags)
-  runner.run()
+  print("experiments = [", end="")
+  if flags['compare']:
+    # MB: One Experiment per configuration, all on the same deals
+    runs = comparison_flags(flags)
+    scores = run_paired([Runner(run_flags) for run_flags in runs], flags)
+  else:
+    runner = Runner(flags)
+    runner.run(score_stop(flags))
   print("]")
+  if flags['compare']:
+    print(f"paired = {paired_summary(runs, scores)}")
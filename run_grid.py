@@ -0,0 +1,139 @@
+# Runs a grid of run_experiment configurations across local cores.
+# A grid is players x agent mixes x mcts_types x seeds. Each cell runs run_experiment.py in its own process,
+# largest first, and its output is kept under a hash of its configuration. Cells already done are skipped,
+# and an interrupted cell resumes from its checkpoint, so rerunning a sweep only plays what is missing.
+#
+#   python3 run_grid.py --grid experiments/grids/self_search.json --output experiments/grid_results
+#   python3 run_grid.py --players 2 3 --agents MCTSAgent:VanDenBerghAgent --mcts_types 0 1 --seeds 1 2 --num_episodes 20
+#   python3 run_grid.py --grid experiments/grids/mix_search.json --dry_run
+
+import argparse
+import concurrent.futures
+import hashlib
+import itertools
+import json
+import os
+import subprocess
+import sys
+
+from experiment_results import read_results
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# MB: Rough seconds per move by agent class, to schedule the largest cells first
+MOVE_COST = {'MCTSAgent': 0.2, 'HumanAgent': 0}
+DEFAULT_MOVE_COST = 0.0005
+MOVES_PER_GAME = 60
+
+
+def grid_cells(grid):
+  """Cells of one grid dict: players, agents ([agent, agents] pairs), mcts_types, seeds, num_episodes and
+  optional flags (other run_experiment options). An mcts_types of one character stands for every player"""
+  cells = []
+  for players, (agent, agents), mcts_types, seed in itertools.product(
+      grid['players'], grid['agents'], grid['mcts_types'], grid['seeds']):
+    if len(mcts_types) == 1:
+      mcts_types = mcts_types * players
+    # mcts_types only changes MCTSAgents, so mixes without one share a cell
+    if 'MCTSAgent' not in (agent, agents):
+      mcts_types = '0' * players
+    cells.append({'players': players, 'agent': agent, 'agents': agents, 'mcts_types': mcts_types, 'seed': seed
+                  , 'num_episodes': grid['num_episodes'], 'flags': grid.get('flags', {})})
+  return cells
+
+
+def cell_hash(cell):
+  return hashlib.sha1(json.dumps(cell, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def cell_cost(cell):
+  """Estimated seconds to play the cell"""
+  seats = [cell['agent']] + [cell['agents']] * (cell['players'] - 1)
+  return cell['num_episodes'] * MOVES_PER_GAME / cell['players'] * sum(MOVE_COST.get(seat, DEFAULT_MOVE_COST) for seat in seats)
+
+
+def cell_command(cell, prefix):
+  command = [sys.executable, os.path.join(HERE, 'run_experiment.py'), '--players', str(cell['players'])
+             , '--num_episodes', str(cell['num_episodes']), '--agent', cell['agent'], '--agents', cell['agents']
+             , '--mcts_types', cell['mcts_types'], '--seed', str(cell['seed'])
+             , '--results', prefix + '.jsonl', '--checkpoint', prefix + '.checkpoint.jsonl', '--resume']
+  for flag, value in sorted(cell['flags'].items()):
+    if value is True:
+      command.append(f'--{flag}')
+    elif value is not False:
+      command += [f'--{flag}', str(value)]
+  return command
+
+
+def run_cell(cell, output):
+  """Play the cell unless its output exists. Returns its status: done, skipped or failed"""
+  prefix = os.path.join(output, cell_hash(cell))
+  if os.path.exists(prefix + '.txt'):
+    return 'skipped'
+  command = cell_command(cell, prefix)
+  with open(prefix + '.json', 'w') as config_file:
+    json.dump({'cell': cell, 'command': command}, config_file, indent=1)
+  # The Experiment output only takes its final name once the run has finished
+  with open(prefix + '.txt.tmp', 'w') as out, open(prefix + '.err', 'w') as err:
+    returncode = subprocess.run(command, stdout=out, stderr=err, cwd=HERE).returncode
+  if returncode != 0:
+    return 'failed'
+  os.replace(prefix + '.txt.tmp', prefix + '.txt')
+  return 'done'
+
+
+def cell_summary(cell, output, status):
+  prefix = os.path.join(output, cell_hash(cell))
+  scores = [record['score'] for record in read_results(prefix + '.jsonl')] if os.path.exists(prefix + '.jsonl') else []
+  mean = f"{sum(scores) / len(scores):6.2f}" if scores else '     -'
+  return (f"{cell_hash(cell)} {status:8s} {cell['players']} {cell['agent']}:{cell['agents']} {cell['mcts_types']}"
+          f" seed={cell['seed']} episodes={len(scores)} avg_score={mean}")
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Run a grid of run_experiment configurations across local cores")
+  parser.add_argument('--grid', help="JSON file with a list of grids, see grid_cells")
+  parser.add_argument('--players', type=int, nargs='+', default=[3])
+  parser.add_argument('--agents', nargs='+', default=['VanDenBerghAgent:VanDenBerghAgent']
+                      , help="agent:agents mixes, player 0's class then the others'")
+  parser.add_argument('--mcts_types', nargs='+', default=['0'])
+  parser.add_argument('--seeds', type=int, nargs='+', default=[1])
+  parser.add_argument('--num_episodes', type=int, default=100)
+  parser.add_argument('--output', default=os.path.join(HERE, 'experiments', 'grid_results'))
+  parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Cells run at once")
+  parser.add_argument('--dry_run', action='store_true', help="List the cells in run order with their status")
+  args = parser.parse_args()
+
+  if args.grid:
+    with open(args.grid) as grid_file:
+      grids = json.load(grid_file)
+  else:
+    grids = [{'players': args.players, 'agents': [mix.split(':') for mix in args.agents], 'mcts_types': args.mcts_types
+              , 'seeds': args.seeds, 'num_episodes': args.num_episodes}]
+  cells = {}
+  for grid in grids:
+    for cell in grid_cells(grid):
+      cells[cell_hash(cell)] = cell
+  # MB: Largest first, so a long cell does not start last and hold up the end of the sweep
+  cells = sorted(cells.values(), key=cell_cost, reverse=True)
+  os.makedirs(args.output, exist_ok=True)
+
+  if args.dry_run:
+    for cell in cells:
+      done = os.path.exists(os.path.join(args.output, cell_hash(cell) + '.txt'))
+      print(cell_summary(cell, args.output, 'done' if done else 'todo'))
+    return
+  with concurrent.futures.ThreadPoolExecutor(max(args.workers, 1)) as executor:
+    futures = {executor.submit(run_cell, cell, args.output): cell for cell in cells}
+    statuses = {}
+    for future in concurrent.futures.as_completed(futures):
+      cell = futures[future]
+      statuses[cell_hash(cell)] = future.result()
+      print(cell_summary(cell, args.output, statuses[cell_hash(cell)]), flush=True)
+  failed = [name for name, status in statuses.items() if status == 'failed']
+  if failed:
+    sys.exit(f"{len(failed)} cells failed, see their .err files: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+  main()